@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+from datetime import date
+from types import SimpleNamespace
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import case, delete, func, insert, update
+from sqlalchemy.orm import Session
+import models
+from database import SessionLocal, get_engine
+
+# Gifting analytics served from gift_rollups, one row per (user, contact, year), and
+# gift_year_rollups, the same totals per (user, year).
+# Write paths take a snapshot of the recipients they touch before and after the change
+# and apply the difference in the same transaction:
+#
+#   before = analytics.snapshot(db, recipient_ids=[recipient.id])
+#   ...modify...
+#   analytics.record_change(db, before, analytics.snapshot(db, recipient_ids=[recipient.id]))
+#   db.commit()
+#
+# Archived events keep counting: archiving and restoring move rows without touching the rollups.
+# `python analytics.py rebuild` recomputes the table from live and archived events.
+
+UNDATED_YEAR = 0
+METRICS = (
+    "recipients", "gifts", "spent", "purchased_gifts", "purchased_spent",
+    "budgeted_recipients", "budget", "budgeted_spent", "over_budget",
+)
+
+Key = Tuple[int, int, int]
+Snapshot = Dict[int, Tuple[Key, Dict[str, float]]]
+
+
+def _recipient_totals(db: Session):
+    purchased = models.Gift.purchased.is_(True)
+    return db.query(
+        models.EventRecipient.id,
+        models.EventRecipient.contact_id,
+        models.EventRecipient.budget_limit,
+        models.Event.user_id,
+        models.Event.date,
+        func.count(models.Gift.id).label("gifts"),
+        func.coalesce(func.sum(models.Gift.amount), 0).label("spent"),
+        func.coalesce(func.sum(case((purchased, 1), else_=0)), 0).label("purchased_gifts"),
+        func.coalesce(func.sum(case((purchased, models.Gift.amount), else_=0)), 0).label("purchased_spent"),
+    ).join(models.Event, models.Event.id == models.EventRecipient.event_id).outerjoin(
+        models.Gift, models.Gift.event_recipient_id == models.EventRecipient.id
+    ).group_by(
+        models.EventRecipient.id, models.EventRecipient.contact_id, models.EventRecipient.budget_limit,
+        models.Event.user_id, models.Event.date
+    )
+
+
+def _contribution(row) -> Tuple[Key, Dict[str, float]]:
+    budget = row.budget_limit or 0.0
+    spent = float(row.spent or 0)
+    budgeted = budget > 0
+    key = (row.user_id, row.contact_id, row.date.year if row.date else UNDATED_YEAR)
+    return key, {
+        "recipients": 1,
+        "gifts": row.gifts,
+        "spent": spent,
+        "purchased_gifts": int(row.purchased_gifts or 0),
+        "purchased_spent": float(row.purchased_spent or 0),
+        "budgeted_recipients": 1 if budgeted else 0,
+        "budget": budget,
+        "budgeted_spent": spent if budgeted else 0.0,
+        "over_budget": 1 if budgeted and spent > budget else 0,
+    }
+
+
+def snapshot(db: Session, recipient_ids: Iterable[int] = None, event_id: int = None) -> Snapshot:
+    # Current contribution of each recipient; cost is proportional to their gifts only
+    db.flush()
+    query = _recipient_totals(db)
+    if event_id is not None:
+        query = query.filter(models.EventRecipient.event_id == event_id)
+    else:
+        query = query.filter(models.EventRecipient.id.in_(list(recipient_ids or [])))
+    return {row.id: _contribution(row) for row in query}
+
+
+def _load(archived: models.ArchivedEvent) -> Dict:
+    import archive  # Not at the top: archive imports operations, which imports this module
+    return archive.load(archived)
+
+
+def _archived_rows(document: Dict):
+    # The same columns _recipient_totals returns, read from an archived document
+    event = document["event"]
+    for r in document["recipients"]:
+        gifts = r["gifts"]
+        yield SimpleNamespace(
+            id=r["id"],
+            contact_id=r["contact_id"],
+            budget_limit=r["budget_limit"],
+            user_id=event["user_id"],
+            date=date.fromisoformat(event["date"]) if event["date"] else None,
+            gifts=len(gifts),
+            spent=sum(g["amount"] or 0 for g in gifts),
+            purchased_gifts=sum(1 for g in gifts if g["purchased"]),
+            purchased_spent=sum(g["amount"] or 0 for g in gifts if g["purchased"]),
+        )
+
+
+def document_snapshot(document: Dict) -> Snapshot:
+    return {row.id: _contribution(row) for row in _archived_rows(document)}
+
+
+def archived_snapshot(archived: models.ArchivedEvent) -> Snapshot:
+    return document_snapshot(_load(archived))
+
+
+def record_change(db: Session, before: Snapshot, after: Snapshot):
+    deltas: Dict[Key, Dict[str, float]] = {}
+    for sign, state in ((-1, before), (1, after)):
+        for key, values in state.values():
+            totals = deltas.setdefault(key, dict.fromkeys(METRICS, 0))
+            for metric, value in values.items():
+                totals[metric] += sign * value
+    for key, totals in deltas.items():
+        if any(totals.values()):
+            _apply(db, key, totals)
+
+
+def _apply(db: Session, key: Key, totals: Dict[str, float]):
+    user_id, contact_id, year = key
+    _upsert(db, models.GiftRollup.__table__, {"user_id": user_id, "contact_id": contact_id, "year": year}, totals)
+    _upsert(db, models.GiftYearRollup.__table__, {"user_id": user_id, "year": year}, totals)
+
+
+def _upsert(db: Session, table, key: Dict[str, int], totals: Dict[str, float]):
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        stmt = upsert(table).values(**key, **totals)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c[column] for column in key],
+            set_={metric: table.c[metric] + stmt.excluded[metric] for metric in METRICS}
+        ))
+        return
+    updated = db.execute(update(table).where(
+        *(table.c[column] == value for column, value in key.items())
+    ).values({metric: table.c[metric] + value for metric, value in totals.items()}))
+    if updated.rowcount == 0:
+        db.execute(insert(table).values(**key, **totals))
+
+
+def rebuild(db: Session, user_id: Optional[int] = None) -> int:
+    # Recompute from scratch; the caller commits. Memory is proportional to the number of rollup rows.
+    query = _recipient_totals(db)
+    if user_id is not None:
+        query = query.filter(models.Event.user_id == user_id)
+    for model in (models.GiftRollup, models.GiftYearRollup):
+        clear = delete(model)
+        if user_id is not None:
+            clear = clear.where(model.user_id == user_id)
+        db.execute(clear)
+
+    archived = db.query(models.ArchivedEvent)
+    if user_id is not None:
+        archived = archived.filter(models.ArchivedEvent.user_id == user_id)
+    sources = [query.yield_per(1000), (row for event in archived.yield_per(100) for row in _archived_rows(_load(event)))]
+
+    rows: Dict[Key, Dict[str, float]] = {}
+    year_rows: Dict[Tuple[int, int], Dict[str, float]] = {}
+    for source in sources:
+        for row in source:
+            key, values = _contribution(row)
+            totals = rows.setdefault(key, dict.fromkeys(METRICS, 0))
+            year_totals = year_rows.setdefault((key[0], key[2]), dict.fromkeys(METRICS, 0))
+            for metric, value in values.items():
+                totals[metric] += value
+                year_totals[metric] += value
+    batch = [
+        {"user_id": key[0], "contact_id": key[1], "year": key[2], **totals}
+        for key, totals in rows.items()
+    ]
+    for i in range(0, len(batch), 1000):
+        db.execute(insert(models.GiftRollup), batch[i:i + 1000])
+    year_batch = [{"user_id": key[0], "year": key[1], **totals} for key, totals in year_rows.items()]
+    for i in range(0, len(year_batch), 1000):
+        db.execute(insert(models.GiftYearRollup), year_batch[i:i + 1000])
+    return len(batch)
+
+
+# Queries for the API
+
+def _summary(row) -> Dict:
+    result = {metric: getattr(row, metric) or 0 for metric in METRICS}
+    for metric in ("spent", "purchased_spent", "budget", "budgeted_spent"):
+        result[metric] = round(float(result[metric]), 2)
+    result["budget_used"] = round(result["budgeted_spent"] / result["budget"], 4) if result["budget"] else None
+    return result
+
+
+def years(db: Session, user_id: int):
+    # One stored row per year returned, however many contacts the user has
+    rows = db.query(models.GiftYearRollup).filter(
+        models.GiftYearRollup.user_id == user_id,
+        models.GiftYearRollup.recipients > 0
+    ).order_by(models.GiftYearRollup.year.desc())
+    return [{"year": row.year or None, **_summary(row)} for row in rows]
+
+
+def contacts(db: Session, user_id: int, year: Optional[int] = None, contact_id: Optional[int] = None, skip: int = 0, limit: int = 100):
+    query = db.query(models.GiftRollup, models.Contact.name).outerjoin(
+        models.Contact, models.Contact.id == models.GiftRollup.contact_id
+    ).filter(
+        models.GiftRollup.user_id == user_id,
+        models.GiftRollup.recipients > 0
+    )
+    if year is not None:
+        query = query.filter(models.GiftRollup.year == year)
+    if contact_id is not None:
+        query = query.filter(models.GiftRollup.contact_id == contact_id)
+    query = query.order_by(models.GiftRollup.year.desc(), models.GiftRollup.spent.desc(), models.GiftRollup.contact_id)
+    return [
+        {"contact_id": rollup.contact_id, "contact_name": name, "year": rollup.year or None, **_summary(rollup)}
+        for rollup, name in query.offset(skip).limit(limit)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gift Planner analytics rollups")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subcommands.add_parser("rebuild", help="Recompute the rollup tables from events, recipients and gifts")
+    rebuild_parser.add_argument("--user", type=int, help="Only rebuild this user's rows")
+    args = parser.parse_args(argv)
+
+    get_engine()
+    db = SessionLocal()
+    try:
+        count = rebuild(db, args.user)
+        db.commit()
+    finally:
+        db.close()
+    print(f"✅ Rebuilt {count} rollup row(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
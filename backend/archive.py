@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import logging
+import os
+import sys
+import zlib
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import Session, selectinload
+import models
+import analytics
+from database import SessionLocal, get_engine
+from operations import Progress, _chunks
+
+# Cold storage for past events. Archiving moves an event with its recipients, gifts and shares
+# out of the live tables into one archived_events row holding compressed JSON, so everyday
+# queries stop joining against them. GET /events/{id} still reads archived events, and
+# restoring puts the rows back under their original ids when those are still free.
+#
+#   python archive.py run                    # archive events older than ARCHIVE_AFTER_DAYS
+#   python archive.py run --older-than-days 730 --user 42
+#
+# Work is split into ARCHIVE_BATCH_SIZE events per transaction so row locks are held briefly.
+
+logger = logging.getLogger("archive")
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "50"))
+
+def default_cutoff() -> date:
+    return date.today() - timedelta(days=ARCHIVE_AFTER_DAYS)
+
+
+def encode(document: Dict) -> bytes:
+    return zlib.compress(json.dumps(document, default=str, separators=(",", ":")).encode(), 6)
+
+
+def load(archived: models.ArchivedEvent) -> Dict:
+    return json.loads(zlib.decompress(archived.payload))
+
+
+def _document(event: models.Event) -> Dict:
+    return {
+        "event": {"id": event.id, "name": event.name, "date": event.date, "description": event.description, "user_id": event.user_id},
+        "recipients": [
+            {
+                "id": r.id, "contact_id": r.contact_id, "budget_limit": r.budget_limit, "notes": r.notes,
+                # Kept for display; restore links back to contact_id
+                "contact": {
+                    "id": r.contact_id, "user_id": r.contact.user_id, "name": r.contact.name,
+                    "email": r.contact.email, "phone": r.contact.phone, "notes": r.contact.notes,
+                } if r.contact else None,
+                "gifts": [
+                    {"id": g.id, "name": g.name, "description": g.description, "amount": g.amount, "purchased": g.purchased, "url": g.url}
+                    for g in r.gifts
+                ],
+            }
+            for r in event.recipients
+        ],
+        "shares": [
+            {"id": s.id, "shared_with_user_id": s.shared_with_user_id, "permission": s.permission}
+            for s in event.shares
+        ],
+    }
+
+
+def _archive_chunk(db: Session, event_ids: List[int]) -> List[int]:
+    events = db.query(models.Event).options(
+        selectinload(models.Event.recipients).selectinload(models.EventRecipient.gifts),
+        selectinload(models.Event.recipients).selectinload(models.EventRecipient.contact),
+        selectinload(models.Event.shares),
+    ).filter(models.Event.id.in_(event_ids)).all()
+    # Databases from before ids were monotonic (migration 0010) may have reused an archived id
+    taken = {event_id for (event_id,) in db.query(models.ArchivedEvent.id).filter(models.ArchivedEvent.id.in_(event_ids))}
+    if taken:
+        logger.warning("Not archiving events %s: an archived event already has the same id", sorted(taken))
+        events = [event for event in events if event.id not in taken]
+    if not events:
+        return []
+    ids = [event.id for event in events]
+    recipient_ids = [r.id for event in events for r in event.recipients]
+    db.execute(insert(models.ArchivedEvent), [
+        {"id": event.id, "user_id": event.user_id, "name": event.name, "date": event.date, "payload": encode(_document(event))}
+        for event in events
+    ])
+    if recipient_ids:
+        db.execute(delete(models.Gift).where(models.Gift.event_recipient_id.in_(recipient_ids)).execution_options(synchronize_session=False))
+    db.execute(delete(models.EventRecipient).where(models.EventRecipient.event_id.in_(ids)).execution_options(synchronize_session=False))
+    db.execute(delete(models.EventShare).where(models.EventShare.event_id.in_(ids)).execution_options(synchronize_session=False))
+    db.execute(delete(models.Event).where(models.Event.id.in_(ids)).execution_options(synchronize_session=False))
+    # Drop the deleted rows from the identity map; the session may hold other objects (e.g. the job)
+    for event in events:
+        for recipient in event.recipients:
+            for gift in recipient.gifts:
+                db.expunge(gift)
+            db.expunge(recipient)
+        for share in event.shares:
+            db.expunge(share)
+        db.expunge(event)
+    return ids
+
+
+def archive_events(db: Session, owner_id: Optional[int] = None, before: Optional[date] = None, event_ids: Optional[List[int]] = None, progress: Progress = None) -> List[int]:
+    # Dated events before `before`, and/or the given ids; owner_id=None covers every user
+    query = db.query(models.Event.id)
+    if owner_id is not None:
+        query = query.filter(models.Event.user_id == owner_id)
+    if event_ids is not None:
+        query = query.filter(models.Event.id.in_(event_ids))
+    if before is not None:
+        query = query.filter(models.Event.date < before)
+    candidates = [event_id for (event_id,) in query.order_by(models.Event.id)]
+
+    archived = []
+    done = 0
+    for chunk in _chunks(candidates, ARCHIVE_BATCH_SIZE):
+        archived.extend(_archive_chunk(db, chunk))
+        done += len(chunk)
+        if progress:
+            progress(done, len(candidates))
+        db.commit()
+    return archived
+
+
+def _restore(db: Session, document: Dict) -> models.Event:
+    recipients = document["recipients"]
+    # Archived rows hold no foreign key, so their contacts may have been deleted since. Those recipients
+    # (and their gifts) can't be restored; they leave the rollups with the archived row.
+    contact_ids = {r["contact_id"] for r in recipients}
+    existing = {contact_id for (contact_id,) in db.query(models.Contact.id).filter(models.Contact.id.in_(contact_ids))} if contact_ids else set()
+    dropped = [r["id"] for r in recipients if r["contact_id"] not in existing]
+    if dropped:
+        logger.warning("Restoring event %s without recipients %s: their contacts were deleted", document["event"]["id"], dropped)
+        contributions = analytics.document_snapshot(document)
+        analytics.record_change(db, {recipient_id: contributions[recipient_id] for recipient_id in dropped}, {})
+        recipients = [r for r in recipients if r["contact_id"] in existing]
+    recipient_ids = [r["id"] for r in recipients]
+    gift_ids = [g["id"] for r in recipients for g in r["gifts"]]
+    # SQLite may hand a freed id to a new row; restore under fresh ids rather than collide
+    keep_ids = not (
+        db.query(models.Event.id).filter(models.Event.id == document["event"]["id"]).first()
+        or (recipient_ids and db.query(models.EventRecipient.id).filter(models.EventRecipient.id.in_(recipient_ids)).first())
+        or (gift_ids and db.query(models.Gift.id).filter(models.Gift.id.in_(gift_ids)).first())
+    )
+
+    data = document["event"]
+    event = models.Event(
+        id=data["id"] if keep_ids else None,
+        name=data["name"],
+        date=date.fromisoformat(data["date"]) if data["date"] else None,
+        description=data["description"],
+        user_id=data["user_id"]
+    )
+    db.add(event)
+    db.flush()
+    for r in recipients:
+        recipient = models.EventRecipient(
+            id=r["id"] if keep_ids else None,
+            event_id=event.id,
+            contact_id=r["contact_id"],
+            budget_limit=r["budget_limit"],
+            notes=r["notes"]
+        )
+        db.add(recipient)
+        db.flush()
+        if r["gifts"]:
+            db.execute(insert(models.Gift), [
+                {**{k: v for k, v in g.items() if keep_ids or k != "id"}, "event_recipient_id": recipient.id}
+                for g in r["gifts"]
+            ])
+    for s in document["shares"]:
+        db.add(models.EventShare(
+            event_id=event.id,
+            shared_with_user_id=s["shared_with_user_id"],
+            permission=s["permission"]
+        ))
+    return event
+
+
+def restore_events(db: Session, owner_id: int, event_ids: List[int], progress: Progress = None) -> Dict[int, int]:
+    # Returns {archived id: live id}; they differ only when the original ids were taken
+    restored = {}
+    done = 0
+    for chunk in _chunks(list(dict.fromkeys(event_ids)), ARCHIVE_BATCH_SIZE):
+        rows = db.query(models.ArchivedEvent).filter(
+            models.ArchivedEvent.id.in_(chunk),
+            models.ArchivedEvent.user_id == owner_id
+        ).all()
+        for row in rows:
+            restored[row.id] = _restore(db, load(row)).id
+            db.delete(row)
+        done += len(chunk)
+        if progress:
+            progress(done, len(event_ids))
+        db.commit()
+    return restored
+
+
+def get_archived(db: Session, event_id: int, user_id: int) -> Optional[Dict]:
+    # The archived document if the user owns the event or it was shared with them
+    row = db.query(models.ArchivedEvent).filter(models.ArchivedEvent.id == event_id).first()
+    if not row:
+        return None
+    document = load(row)
+    if row.user_id != user_id and all(s["shared_with_user_id"] != user_id for s in document["shares"]):
+        return None
+    return document
+
+
+def detail(document: Dict) -> Dict:
+    # Shape of schemas.EventDetail
+    event = document["event"]
+    return {
+        **event,
+        "archived": True,
+        "recipients": [
+            {
+                "id": r["id"], "event_id": event["id"], "contact_id": r["contact_id"], "budget_limit": r["budget_limit"],
+                "notes": r["notes"], "contact": r["contact"] or {"id": r["contact_id"], "user_id": event["user_id"], "name": "(deleted contact)"},
+                "gifts": [{**g, "event_recipient_id": r["id"]} for g in r["gifts"]],
+            }
+            for r in document["recipients"]
+        ],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gift Planner event archival")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    run = subcommands.add_parser("run", help="Archive dated events older than the cutoff")
+    run.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    run.add_argument("--user", type=int, help="Only archive this user's events")
+    args = parser.parse_args(argv)
+
+    get_engine()
+    db = SessionLocal()
+    try:
+        before = date.today() - timedelta(days=args.older_than_days)
+        archived = archive_events(db, args.user, before=before, progress=lambda done, total: print(f"  {done}/{total}", end="\r"))
+    finally:
+        db.close()
+    print(f"✅ Archived {len(archived)} event(s) dated before {before}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
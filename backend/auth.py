@@ -1,15 +1,39 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import NamedTuple, Optional
 from jose import JWTError, jwt
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
 import bcrypt
+import threading
+import time
+import uuid
 from sqlalchemy.orm import Session
 import models
 import schemas
+import sharedcache
 import os
 
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key-change-in-production")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_DAYS = 30
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+
+# How stale a worker's view of token versions and revocations may get.
+# Workers of other servers pick up a logout within this many seconds; see sharedcache.py.
+TOKEN_VERSION_CACHE_SECONDS = int(os.getenv("TOKEN_VERSION_CACHE_SECONDS", "60"))
+REVOCATION_SYNC_SECONDS = int(os.getenv("REVOCATION_SYNC_SECONDS", "30"))
+# A rotated refresh token presented again within this window is a concurrent refresh
+# (e.g. two tabs), not a replay, and gets a new pair instead of ending every session
+REFRESH_REUSE_GRACE_SECONDS = int(os.getenv("REFRESH_REUSE_GRACE_SECONDS", "10"))
+# Stream tickets end up in URLs (and so in access logs): single use, and only valid this long
+STREAM_TICKET_SECONDS = int(os.getenv("STREAM_TICKET_SECONDS", "30"))
+# Slots in the token-version table shared by the workers of one server (32 bytes each)
+AUTH_CACHE_SLOTS = int(os.getenv("AUTH_CACHE_SLOTS", "65536"))
+
+class CurrentUser(NamedTuple):
+    # Identity taken from a verified access token, without loading the users row
+    id: int
+    username: str
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
@@ -44,18 +68,209 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)
+        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str, db: Session):
+def create_token_pair(user: models.User) -> dict:
+    version = user.token_version or 0
+    _token_versions.set(user.id, version)
+    claims = {"sub": user.username, "uid": user.id, "ver": version}
+    access_token = create_access_token(
+        {**claims, "type": "access", "jti": uuid.uuid4().hex},
+        timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    refresh_token = create_access_token(
+        {**claims, "type": "refresh", "jti": uuid.uuid4().hex},
+        timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+def decode_token(token: str, token_type: str = "access") -> Optional[dict]:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-        user = db.query(models.User).filter(models.User.username == username).first()
-        return user
     except JWTError:
         return None
+    if payload.get("type") != token_type or payload.get("uid") is None or payload.get("jti") is None:
+        return None
+    return payload
+
+
+def scope_user_id(scope) -> Optional[int]:
+    # User id from an ASGI request's bearer token, for middleware that runs before the route.
+    # Signature check only: revocation is enforced later by get_current_user.
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer":
+                payload = decode_token(token, "access")
+                return payload["uid"] if payload else None
+    return None
+
+
+class TokenVersionCache:
+    # user id -> token_version in shared memory, so a lookup one worker paid for serves them all
+    # and a logout on one worker is seen by the others on their next request.
+    # A miss, stale entry or slot collision costs one query.
+    def __init__(self, slots: int = AUTH_CACHE_SLOTS):
+        self._versions = sharedcache.SharedIntTable(slots)
+
+    def get(self, db: Session, user_id: int) -> Optional[int]:
+        version = self._versions.get(user_id, TOKEN_VERSION_CACHE_SECONDS)
+        if version is not None:
+            return version
+        row = db.query(models.User.token_version).filter(models.User.id == user_id).first()
+        if row is None:
+            self.invalidate(user_id)
+            return None
+        self.set(user_id, row[0] or 0)
+        return row[0] or 0
+
+    def set(self, user_id: int, version: int):
+        self._versions.set(user_id, version)
+
+    def invalidate(self, user_id: int):
+        self._versions.invalidate(user_id)
+
+
+class RevocationList:
+    # In-memory set of revoked token ids backed by the revoked_tokens table.
+    # Lookups are O(1); rows revoked by other workers are pulled in every REVOCATION_SYNC_SECONDS,
+    # or on the next request when a worker of the same server bumps the shared epoch.
+    # Syncs go by revoked_at rather than id: PostgreSQL ids can commit out of order.
+    # Each sync re-reads this much before the previous one, covering revocations whose
+    # transaction was still open then and clock differences between hosts.
+    SYNC_OVERLAP_SECONDS = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._expiry = {}
+        self._since = None
+        self._synced_at = None
+        self._epoch = sharedcache.SharedEpoch()
+        self._seen_epoch = self._epoch.read()
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in self._expiry
+
+    def revoke(self, db: Session, jti: str, expires_at: datetime, reason: Optional[str] = None) -> bool:
+        # False when the token was already revoked, possibly just now by another worker
+        if jti in self._expiry:
+            return False
+        db.add(models.RevokedToken(jti=jti, expires_at=expires_at, revoked_at=datetime.utcnow(), reason=reason))
+        try:
+            db.commit()
+            revoked = True
+        except IntegrityError:
+            db.rollback()
+            revoked = False
+        with self._lock:
+            self._expiry[jti] = expires_at
+        if revoked:
+            self._epoch.bump()
+        return revoked
+
+    def rotated_since(self, db: Session, jti: str, seconds: float) -> bool:
+        return db.query(models.RevokedToken.id).filter(
+            models.RevokedToken.jti == jti,
+            models.RevokedToken.reason == "rotated",
+            models.RevokedToken.revoked_at >= datetime.utcnow() - timedelta(seconds=seconds)
+        ).first() is not None
+
+    def sync(self, db: Session, force: bool = False):
+        now = time.monotonic()
+        epoch = self._epoch.read()
+        if epoch != self._seen_epoch:
+            self._seen_epoch = epoch
+            force = True
+        if not force and self._synced_at is not None and now - self._synced_at < REVOCATION_SYNC_SECONDS:
+            return
+        with self._lock:
+            if not force and self._synced_at is not None and now - self._synced_at < REVOCATION_SYNC_SECONDS:
+                return
+            self._synced_at = now
+            utcnow = datetime.utcnow()
+            query = db.query(models.RevokedToken.jti, models.RevokedToken.expires_at).filter(
+                models.RevokedToken.expires_at > utcnow
+            )
+            if self._since is not None:
+                query = query.filter(models.RevokedToken.revoked_at >= self._since - timedelta(seconds=self.SYNC_OVERLAP_SECONDS))
+            self._since = utcnow
+            for jti, expires_at in query:
+                self._expiry[jti] = expires_at
+            # Expired tokens fail signature checks anyway, so their entries can go
+            for jti in [jti for jti, expires_at in self._expiry.items() if expires_at < utcnow]:
+                del self._expiry[jti]
+
+
+_token_versions = TokenVersionCache()
+_revocations = RevocationList()
+
+def verify_token(token: str, db: Session) -> Optional[CurrentUser]:
+    payload = decode_token(token, "access")
+    if payload is None:
+        return None
+    _revocations.sync(db)
+    if _revocations.is_revoked(payload["jti"]):
+        return None
+    if _token_versions.get(db, payload["uid"]) != payload.get("ver"):
+        return None
+    return CurrentUser(id=payload["uid"], username=payload["sub"])
+
+def refresh_tokens(db: Session, refresh_token: str) -> Optional[dict]:
+    payload = decode_token(refresh_token, "refresh")
+    if payload is None:
+        return None
+    # Refreshes are rare, so always catch up on rotations done by other workers
+    _revocations.sync(db, force=True)
+    user = db.query(models.User).filter(models.User.id == payload["uid"]).first()
+    if not user or (user.token_version or 0) != payload.get("ver"):
+        return None
+    if _revocations.is_revoked(payload["jti"]):
+        if _revocations.rotated_since(db, payload["jti"], REFRESH_REUSE_GRACE_SECONDS):
+            return create_token_pair(user)
+        # A rotated refresh token was replayed, so it may have leaked: end every session
+        revoke_all_sessions(db, user.id)
+        return None
+    if _revocations.revoke(db, payload["jti"], datetime.utcfromtimestamp(payload["exp"]), "rotated"):
+        return create_token_pair(user)
+    # A refresh on another worker rotated it between the check above and our insert
+    if _revocations.rotated_since(db, payload["jti"], REFRESH_REUSE_GRACE_SECONDS):
+        return create_token_pair(user)
+    return None
+
+def create_stream_ticket(user: CurrentUser, event_id: int) -> str:
+    # EventSource can't send headers; this goes in the stream URL instead of an access token
+    return create_access_token(
+        {"sub": user.username, "uid": user.id, "event_id": event_id, "type": "stream", "jti": uuid.uuid4().hex},
+        timedelta(seconds=STREAM_TICKET_SECONDS)
+    )
+
+def redeem_stream_ticket(db: Session, ticket: str, event_id: int) -> Optional[CurrentUser]:
+    payload = decode_token(ticket, "stream")
+    if payload is None or payload.get("event_id") != event_id:
+        return None
+    # Revoking on first use makes a ticket copied from a log worthless
+    if not _revocations.revoke(db, payload["jti"], datetime.utcfromtimestamp(payload["exp"]), "used"):
+        return None
+    return CurrentUser(id=payload["uid"], username=payload["sub"])
+
+def revoke_token(db: Session, token: str, token_type: str = "access"):
+    payload = decode_token(token, token_type)
+    if payload is not None:
+        _revocations.revoke(db, payload["jti"], datetime.utcfromtimestamp(payload["exp"]))
+
+def revoke_all_sessions(db: Session, user_id: int):
+    db.execute(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(token_version=func.coalesce(models.User.token_version, 0) + 1)
+    )
+    db.commit()
+    _token_versions.invalidate(user_id)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+# Measures how long a fresh worker takes to become useful:
+#   import   - seconds to `import main` in a new interpreter
+#   ready    - seconds from process start until GET /health first answers
+#
+#   python bench_startup.py --runs 5
+# Uses a throwaway SQLite database unless DATABASE_URL is set.
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_import(env):
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def measure_ready(env, timeout=30):
+    port = _free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError("Server did not become ready")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API cold start")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if "DATABASE_URL" not in env:
+        env["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+        # Migrate once up front, as a deploy would, so runs measure boot only
+        subprocess.run([sys.executable, "migrate.py", "upgrade"], cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+    env["AUTO_MIGRATE"] = "false"
+
+    imports = [measure_import(env) for _ in range(args.runs)]
+    ready = [measure_ready(env) for _ in range(args.runs)]
+    print(f"import main:          median {statistics.median(imports) * 1000:7.1f} ms  (min {min(imports) * 1000:.1f})")
+    print(f"start -> first reply: median {statistics.median(ready) * 1000:7.1f} ms  (min {min(ready) * 1000:.1f})")
+
+
+if __name__ == "__main__":
+    main()
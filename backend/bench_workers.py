@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import serve
+
+# Measures throughput of serve.py as the worker count grows:
+#
+#   python bench_workers.py --workers 1 2 4 --clients 32 --seconds 10
+#
+# Each run starts a fresh server with WEB_CONCURRENCY=N, then client processes send
+# authenticated GET /contacts requests over keep-alive connections for a fixed time.
+# The client processes need cores too: on small machines their load limits the result.
+# Uses a throwaway SQLite database unless DATABASE_URL is set.
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+PATH = "/contacts?limit=20"
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(port, timeout=60):
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("Server did not become ready")
+
+
+def _post(port, path, data, form=False):
+    body = urllib.parse.urlencode(data).encode() if form else json.dumps(data).encode()
+    request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=body, headers={
+        "Content-Type": "application/x-www-form-urlencoded" if form else "application/json"
+    })
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def _token(port):
+    credentials = {"username": "bench", "password": "bench-password"}
+    try:
+        _post(port, "/register", {**credentials, "email": "bench@example.com", "full_name": "Bench"})
+    except urllib.error.HTTPError:
+        pass  # Registered by an earlier run against the same database
+    return _post(port, "/token", credentials, form=True)["access_token"]
+
+
+def _client(port, token, seconds, results):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    headers = {"Authorization": f"Bearer {token}"}
+    done = errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        try:
+            conn.request("GET", PATH, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                done += 1
+            else:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    conn.close()
+    results.put((done, errors))
+
+
+def measure(env, workers, clients, seconds):
+    port = _free_port()
+    server_env = {**env, "WEB_CONCURRENCY": str(workers), "HOST": "127.0.0.1", "PORT": str(port), "ACCESS_LOG": ""}
+    proc = subprocess.Popen([sys.executable, "serve.py"], cwd=BACKEND_DIR, env=server_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_ready(port)
+        token = _token(port)
+        # Warm every worker's pool and caches before timing
+        for _ in range(workers * 20):
+            urllib.request.urlopen(urllib.request.Request(f"http://127.0.0.1:{port}{PATH}", headers={"Authorization": f"Bearer {token}"})).read()
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=_client, args=(port, token, seconds, results)) for _ in range(clients)]
+        for p in procs:
+            p.start()
+        totals = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+        return sum(done for done, _ in totals) / seconds, sum(errors for _, errors in totals)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark throughput against worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if "DATABASE_URL" not in env:
+        env["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+        subprocess.run([sys.executable, "migrate.py", "upgrade"], cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+    env["AUTO_MIGRATE"] = "false"
+    env["RATE_LIMIT_ENABLED"] = "false"
+
+    print(f"{serve.cpu_count()} CPU(s), {args.clients} clients, GET {PATH}")
+    baseline = None
+    for workers in args.workers:
+        rate, errors = measure(env, workers, args.clients, args.seconds)
+        baseline = baseline or rate
+        print(f"{workers:3d} worker(s): {rate:9.1f} req/s  x{rate / baseline:.2f}" + (f"  ({errors} errors)" if errors else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,15 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql import Select
+import itertools
+import sharedcache
+import logging
 import os
+import threading
+import time
+
+logger = logging.getLogger("database")
 
 # Use PostgreSQL in production, SQLite in development
 SQLALCHEMY_DATABASE_URL = os.getenv(
@@ -9,11 +17,121 @@ SQLALCHEMY_DATABASE_URL = os.getenv(
     "sqlite:///./gift_planner.db"
 ).replace("postgres://", "postgresql://", 1)  # Railway uses postgres://, SQLAlchemy needs postgresql://
 
-connect_args = {"check_same_thread": False} if "sqlite" in SQLALCHEMY_DATABASE_URL else {}
+# Optional read replicas, comma-separated. Read-only endpoints are spread across them.
+REPLICA_URLS = [
+    url.strip().replace("postgres://", "postgresql://", 1)
+    for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+    if url.strip()
+]
+# After a user commits, their reads stay on the primary this long so they see their own writes
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+# Slots for the last-write times read-your-writes checks (8 bytes each)
+READ_YOUR_WRITES_SLOTS = int(os.getenv("READ_YOUR_WRITES_SLOTS", "65536"))
+
+def _connect_args(url):
+    return {"check_same_thread": False} if "sqlite" in url else {}
+
+connect_args = _connect_args(SQLALCHEMY_DATABASE_URL)
+
+
+class ReplicaPool:
+    # Round-robin over replicas, skipping any that recently failed until a ping succeeds
+    def __init__(self, engines):
+        self.engines = engines
+        self._cycle = itertools.cycle(engines) if engines else None
+        self._lock = threading.Lock()
+        self._down_until = {}
+        for replica in engines:
+            event.listen(replica, "handle_error", self._on_error)
+
+    def _on_error(self, context):
+        if context.is_disconnect or isinstance(context.sqlalchemy_exception, exc.OperationalError):
+            self.mark_down(context.engine)
+
+    def mark_down(self, replica):
+        logger.warning("Replica %s unavailable; routing reads elsewhere", replica.url.render_as_string(hide_password=True))
+        self._down_until[replica] = time.monotonic() + REPLICA_RETRY_SECONDS
+
+    def _ping(self, replica) -> bool:
+        try:
+            with replica.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            return False
+
+    def choose(self):
+        if not self._cycle:
+            return None
+        for _ in range(len(self.engines)):
+            with self._lock:
+                replica = next(self._cycle)
+            down_until = self._down_until.get(replica)
+            if down_until is None:
+                return replica
+            if time.monotonic() >= down_until:
+                if self._ping(replica):
+                    self._down_until.pop(replica, None)
+                    return replica
+                self.mark_down(replica)
+        return None
+
+
+class RoutingSession(Session):
+    # Reads go to info["replica"] when one was assigned; flushes and writes always use the primary
+    def get_bind(self, mapper=None, *, clause=None, **kw):
+        replica = self.info.get("replica")
+        if replica is not None and not self._flushing and isinstance(clause, Select):
+            return replica
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
+# The engine is built on first use (normally the app lifespan), not at import time,
+# so importing the app never touches the database
+engine = None
+replicas = ReplicaPool([])
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
+
+_engine_lock = threading.Lock()
+# In shared memory, so a read landing on another serve.py worker still sees the write
+_last_write = sharedcache.SharedTimestamps(READ_YOUR_WRITES_SLOTS)
+
+@event.listens_for(RoutingSession, "after_commit")
+def _remember_write(session):
+    user_id = session.info.get("user_id")
+    if user_id is not None:
+        _last_write.touch(user_id)
+
+def get_engine():
+    global engine, replicas
+    if engine is None:
+        with _engine_lock:
+            if engine is None:
+                replicas = ReplicaPool([create_engine(url, connect_args=_connect_args(url)) for url in REPLICA_URLS])
+                engine = create_engine(
+                    SQLALCHEMY_DATABASE_URL, connect_args=connect_args
+                )
+                SessionLocal.configure(bind=engine)
+    return engine
+
+def dispose_engine():
+    global engine, replicas
+    with _engine_lock:
+        if engine is not None:
+            engine.dispose()
+            engine = None
+        for replica in replicas.engines:
+            replica.dispose()
+        replicas = ReplicaPool([])
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args=connect_args
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def read_session(user_id=None):
+    # Session for read-only handlers: one replica per request keeps its reads consistent
+    get_engine()
+    db = SessionLocal()
+    db.info["user_id"] = user_id
+    if user_id is None or _last_write.age(user_id) > READ_YOUR_WRITES_SECONDS:
+        db.info["replica"] = replicas.choose()
+    return db
 
 Base = declarative_base()
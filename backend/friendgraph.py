@@ -0,0 +1,147 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+import models
+from database import SessionLocal
+
+# In-memory adjacency of accepted friendships for friend-of-friend suggestions.
+# Each user's friends are a sorted array of ints (4 bytes per edge end), loaded from
+# friend_requests in the background at startup and updated in place when a request is
+# accepted here. Other workers' accepts show up after the next reload (FRIEND_GRAPH_TTL_SECONDS);
+# until then GET /friends/suggestions leaves out existing friends using the database.
+
+logger = logging.getLogger("friendgraph")
+
+FRIEND_GRAPH_TTL_SECONDS = float(os.getenv("FRIEND_GRAPH_TTL_SECONDS", "300"))
+# Caps that bound the work per request: at most MAX_FRIENDS_SCANNED friends are expanded,
+# each contributing at most MAX_NEIGHBORS_SCANNED of their own friends. Past the caps,
+# mutual friend counts are estimates from an evenly spaced sample.
+MAX_FRIENDS_SCANNED = int(os.getenv("SUGGESTIONS_MAX_FRIENDS_SCANNED", "500"))
+MAX_NEIGHBORS_SCANNED = int(os.getenv("SUGGESTIONS_MAX_NEIGHBORS_SCANNED", "200"))
+
+_EMPTY = array("i")
+
+
+def _spread(items, cap: int):
+    # Evenly spaced subset so large friend lists are sampled across their whole range
+    if len(items) <= cap:
+        return items
+    step = len(items) / cap
+    return [items[int(i * step)] for i in range(cap)]
+
+
+def _contains(sorted_ids, value: int) -> bool:
+    i = bisect_left(sorted_ids, value)
+    return i < len(sorted_ids) and sorted_ids[i] == value
+
+
+def _link(adjacency: Dict[int, array], a: int, b: int):
+    for user_id, friend_id in ((a, b), (b, a)):
+        ids = adjacency.setdefault(user_id, array("i"))
+        i = bisect_left(ids, friend_id)
+        if i == len(ids) or ids[i] != friend_id:
+            ids.insert(i, friend_id)
+
+
+class FriendGraph:
+    def __init__(self, session_factory):
+        self._session_factory = session_factory
+        self._adjacency: Dict[int, array] = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._reloading = False
+        self._replay = None  # Friendships accepted while a load is reading the table
+
+    def load(self):
+        with self._lock:
+            self._replay = []
+        db = self._session_factory()
+        try:
+            neighbours: Dict[int, List[int]] = {}
+            rows = db.query(models.FriendRequest.from_user_id, models.FriendRequest.to_user_id).filter(
+                models.FriendRequest.status == models.FriendRequestStatus.ACCEPTED.value
+            ).yield_per(10000)
+            for a, b in rows:
+                if a == b:
+                    continue
+                neighbours.setdefault(a, []).append(b)
+                neighbours.setdefault(b, []).append(a)
+        finally:
+            db.close()
+        adjacency = {user_id: array("i", sorted(set(ids))) for user_id, ids in neighbours.items()}
+        with self._lock:
+            for a, b in self._replay:
+                _link(adjacency, a, b)
+            self._replay = None
+            self._adjacency = adjacency
+            self._loaded_at = time.monotonic()
+            self._reloading = False
+        logger.info("Loaded friend graph: %d users, %d friendships", len(adjacency), sum(map(len, adjacency.values())) // 2)
+
+    def _reload_in_background(self):
+        try:
+            self.load()
+        except Exception:
+            logger.exception("Friend graph reload failed")
+            with self._lock:
+                self._reloading = False
+                self._replay = None
+
+    def warm(self):
+        # Called at startup so the first request doesn't wait for the table to load
+        if self._loaded_at is None:
+            threading.Thread(target=self._warm, name="friendgraph-warm", daemon=True).start()
+
+    def _warm(self):
+        try:
+            self._ensure_fresh()
+        except Exception:
+            logger.exception("Friend graph warm-up failed")
+
+    def _ensure_fresh(self):
+        if self._loaded_at is None:
+            # Waits for a warm-up already in progress rather than loading a second copy
+            with self._load_lock:
+                if self._loaded_at is None:
+                    self.load()
+            return
+        if time.monotonic() - self._loaded_at > FRIEND_GRAPH_TTL_SECONDS:
+            # Keep answering from the current copy while a fresh one loads
+            with self._lock:
+                if self._reloading:
+                    return
+                self._reloading = True
+            threading.Thread(target=self._reload_in_background, name="friendgraph-reload", daemon=True).start()
+
+    def add_friendship(self, a: int, b: int):
+        if a == b:
+            return
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((a, b))
+            if self._loaded_at is not None:
+                _link(self._adjacency, a, b)
+
+    def suggestions(self, user_id: int, limit: int = 10, exclude: Iterable[int] = ()) -> List[Tuple[int, int]]:
+        # [(user_id, mutual friend count)], most mutual friends first
+        self._ensure_fresh()
+        adjacency = self._adjacency
+        own = adjacency.get(user_id, _EMPTY)
+        excluded = set(exclude)
+        excluded.add(user_id)
+        counts = Counter()
+        for friend_id in _spread(own, MAX_FRIENDS_SCANNED):
+            for candidate in _spread(adjacency.get(friend_id, _EMPTY), MAX_NEIGHBORS_SCANNED):
+                if candidate not in excluded and not _contains(own, candidate):
+                    counts[candidate] += 1
+        return heapq.nlargest(limit, counts.items(), key=lambda item: (item[1], -item[0]))
+
+
+graph = FriendGraph(SessionLocal)
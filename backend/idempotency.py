@@ -0,0 +1,280 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional, Tuple
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+import auth
+import models
+from database import SessionLocal
+
+# Idempotency-Key support for write requests. The first request with a given key runs
+# normally and its response is stored; retries with the same key get that response back
+# (marked with Idempotent-Replayed: true) without reaching the route or the domain tables.
+# Duplicates that arrive while the first is still running wait for it to finish.
+#
+# Keys are scoped to the authenticated user, method and path. Only successful (2xx/3xx)
+# responses are stored: a 4xx changed nothing, so running it again is safe.
+# IDEMPOTENCY_STORE=memory keeps an LRU per process; "database" shares keys across workers.
+
+logger = logging.getLogger("idempotency")
+
+IDEMPOTENCY_ENABLED = os.getenv("IDEMPOTENCY_ENABLED", "true").lower() == "true"
+IDEMPOTENCY_STORE = os.getenv("IDEMPOTENCY_STORE", "memory")
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+# Requests or responses larger than this are passed through without idempotency
+IDEMPOTENCY_MAX_BODY_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BODY_BYTES", str(1024 * 1024)))
+# How long a duplicate waits for the original to finish before getting 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+# A reservation older than this belongs to a request that died; the key can be reused
+PENDING_TIMEOUT_SECONDS = 60
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+MAX_KEY_LENGTH = 255
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    status: Optional[int]  # None while the first request is still running
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+
+
+class MemoryStore:
+    def __init__(self, max_entries: int = IDEMPOTENCY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, StoredResponse]]" = OrderedDict()
+
+    def reserve(self, key: str, fingerprint: str) -> Optional[StoredResponse]:
+        # Returns the existing entry, or None after reserving the key for this request
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, response = entry
+                age = now - stored_at
+                if age < IDEMPOTENCY_TTL_SECONDS and not (response.status is None and age > PENDING_TIMEOUT_SECONDS):
+                    self._entries.move_to_end(key)
+                    return response
+            self._entries[key] = (now, StoredResponse(fingerprint, None, [], b""))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return None
+
+    def complete(self, key: str, response: StoredResponse):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), response)
+            self._entries.move_to_end(key)
+
+    def release(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1].status is None:
+                del self._entries[key]
+
+
+class DatabaseStore:
+    PURGE_INTERVAL_SECONDS = 600
+
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+        self._purged_at = 0.0
+
+    def _load(self, row: models.IdempotencyKey) -> StoredResponse:
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in json.loads(row.headers or "[]")]
+        return StoredResponse(row.fingerprint, row.status_code, headers, row.body or b"")
+
+    def _purge(self, db):
+        if time.monotonic() - self._purged_at < self.PURGE_INTERVAL_SECONDS:
+            return
+        self._purged_at = time.monotonic()
+        cutoff = datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+        db.execute(delete(models.IdempotencyKey).where(models.IdempotencyKey.created_at < cutoff))
+        db.commit()
+
+    def reserve(self, key: str, fingerprint: str) -> Optional[StoredResponse]:
+        db = self._session_factory()
+        try:
+            self._purge(db)
+            now = datetime.utcnow()
+            row = db.get(models.IdempotencyKey, key)
+            if row is not None:
+                age = (now - row.created_at).total_seconds()
+                if age < IDEMPOTENCY_TTL_SECONDS and not (row.status_code is None and age > PENDING_TIMEOUT_SECONDS):
+                    return self._load(row)
+                db.delete(row)
+                db.flush()
+            db.add(models.IdempotencyKey(key=key, fingerprint=fingerprint, created_at=now))
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another worker reserved it first
+                db.rollback()
+                row = db.get(models.IdempotencyKey, key)
+                return self._load(row) if row else StoredResponse(fingerprint, None, [], b"")
+            return None
+        finally:
+            db.close()
+
+    def complete(self, key: str, response: StoredResponse):
+        db = self._session_factory()
+        try:
+            row = db.get(models.IdempotencyKey, key)
+            if row is None:
+                row = models.IdempotencyKey(key=key)
+                db.add(row)
+            row.fingerprint = response.fingerprint
+            row.status_code = response.status
+            row.headers = json.dumps([(name.decode("latin-1"), value.decode("latin-1")) for name, value in response.headers])
+            row.body = response.body
+            row.created_at = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+
+    def release(self, key: str):
+        db = self._session_factory()
+        try:
+            db.execute(delete(models.IdempotencyKey).where(
+                models.IdempotencyKey.key == key,
+                models.IdempotencyKey.status_code.is_(None)
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+
+def create_store():
+    if IDEMPOTENCY_STORE == "database":
+        return DatabaseStore()
+    return MemoryStore()
+
+
+async def _respond(send, status: int, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app, store=None):
+        self.app = app
+        self.store = store or create_store()
+        # key -> [lock, waiters]: serializes duplicates within this process without polling
+        self._locks = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not IDEMPOTENCY_ENABLED or scope["method"] not in WRITE_METHODS:
+            await self.app(scope, receive, send)
+            return
+        client_key = next((value.decode("latin-1") for name, value in scope["headers"] if name == b"idempotency-key"), None)
+        user_id = auth.scope_user_id(scope) if client_key else None
+        if user_id is None:
+            # No key, or an anonymous request that the route will reject anyway
+            await self.app(scope, receive, send)
+            return
+        if len(client_key) > MAX_KEY_LENGTH:
+            await _respond(send, 400, f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters")
+            return
+
+        # Buffer the request body so it can be fingerprinted, then hand it to the app unchanged
+        chunks, size, more_body = [], 0, True
+        while more_body:
+            message = await receive()
+            if message["type"] != "http.request":
+                return  # Client disconnected
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            more_body = message.get("more_body", False)
+            if size > IDEMPOTENCY_MAX_BODY_BYTES and more_body:
+                break
+        body = b"".join(chunks)
+        replay_receive = self._replay_receive(body, more_body, receive)
+        if size > IDEMPOTENCY_MAX_BODY_BYTES:
+            await self.app(scope, replay_receive, send)
+            return
+
+        fingerprint = hashlib.sha256(b"\0".join([
+            scope["method"].encode(), scope["path"].encode(), scope.get("query_string", b""), body
+        ])).hexdigest()
+        key = f"{user_id}:{scope['method']}:{scope['path']}:{client_key}"
+
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await self._handle(key, fingerprint, scope, replay_receive, send)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(key, None)
+
+    @staticmethod
+    def _replay_receive(body: bytes, more_body: bool, receive):
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": more_body}
+            return await receive()
+        return replay
+
+    async def _handle(self, key, fingerprint, scope, receive, send):
+        # Another worker may hold the key (database store): wait for its response
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            existing = await run_in_threadpool(self.store.reserve, key, fingerprint)
+            if existing is None:
+                break
+            if existing.status is not None:
+                if existing.fingerprint != fingerprint:
+                    await _respond(send, 422, "Idempotency-Key was already used for a different request")
+                    return
+                await send({
+                    "type": "http.response.start",
+                    "status": existing.status,
+                    "headers": existing.headers + [(b"idempotent-replayed", b"true")],
+                })
+                await send({"type": "http.response.body", "body": existing.body})
+                return
+            if time.monotonic() >= deadline:
+                await _respond(send, 409, "A request with this Idempotency-Key is still in progress")
+                return
+            await asyncio.sleep(0.1)
+
+        status, headers, chunks, size = None, [], [], 0
+
+        async def capture(message):
+            nonlocal status, headers, size
+            if message["type"] == "http.response.start":
+                status, headers = message["status"], list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                size += len(chunks[-1])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture)
+        except BaseException:
+            await run_in_threadpool(self.store.release, key)
+            raise
+        if status is not None and status < 400 and size <= IDEMPOTENCY_MAX_BODY_BYTES:
+            await run_in_threadpool(self.store.complete, key, StoredResponse(fingerprint, status, headers, b"".join(chunks)))
+        else:
+            await run_in_threadpool(self.store.release, key)
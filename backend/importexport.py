@@ -0,0 +1,317 @@
+import csv
+import io
+import json
+import re
+from typing import BinaryIO, Callable, Dict, Iterator, Optional, Tuple
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+import models
+import archive
+
+IMPORT_BATCH_SIZE = 500
+EXPORT_BATCH_SIZE = 500
+MAX_REPORTED_ROWS = 1000
+
+# Header aliases seen in common address book exports (Google, Outlook, Apple)
+CSV_FIELD_ALIASES = {
+    "name": "name",
+    "full name": "name",
+    "display name": "name",
+    "email": "email",
+    "e-mail": "email",
+    "email address": "email",
+    "e-mail address": "email",
+    "e-mail 1 - value": "email",
+    "phone": "phone",
+    "phone number": "phone",
+    "mobile": "phone",
+    "mobile phone": "phone",
+    "phone 1 - value": "phone",
+    "notes": "notes",
+    "note": "notes",
+}
+
+EXPORT_CSV_COLUMNS = [
+    "record_type", "id", "name", "email", "phone", "notes", "date", "description",
+    "event_id", "contact_id", "budget_limit", "event_recipient_id", "amount", "purchased", "url",
+]
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str]) -> str:
+    filename = (filename or "").lower()
+    content_type = (content_type or "").lower()
+    if filename.endswith((".vcf", ".vcard")) or "vcard" in content_type:
+        return "vcard"
+    return "csv"
+
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    email = (email or "").strip().lower()
+    return email or None
+
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    digits = re.sub(r"\D", "", phone or "")
+    return digits or None
+
+
+def parse_csv(stream: BinaryIO) -> Iterator[Tuple[int, Dict[str, str]]]:
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    reader = csv.DictReader(text)
+    if not reader.fieldnames:
+        raise ImportFormatError("CSV file has no header row")
+
+    columns = {}
+    for header in reader.fieldnames:
+        field = CSV_FIELD_ALIASES.get((header or "").strip().lower())
+        if field and field not in columns.values():
+            columns[header] = field
+    if "name" not in columns.values() and "email" not in columns.values():
+        raise ImportFormatError("CSV file needs a 'name' or 'email' column")
+
+    # Row 1 is the header, so data rows start at 2 to match spreadsheet numbering
+    for row_number, row in enumerate(reader, start=2):
+        yield row_number, {field: (row.get(header) or "").strip() for header, field in columns.items()}
+
+
+def _unfold_vcard_lines(text: Iterator[str]) -> Iterator[str]:
+    # RFC 6350 line folding: continuation lines start with a space or tab
+    current = None
+    for raw in text:
+        line = raw.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+
+def _unescape_vcard(value: str) -> str:
+    return value.replace("\\n", "\n").replace("\\N", "\n").replace("\\,", ",").replace("\\;", ";").replace("\\\\", "\\")
+
+
+def parse_vcard(stream: BinaryIO) -> Iterator[Tuple[int, Dict[str, str]]]:
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    card = None
+    card_number = 0
+    for line in _unfold_vcard_lines(text):
+        if not line.strip():
+            continue
+        key, _, value = line.partition(":")
+        # Strip parameters (TYPE=...) and group prefixes (item1.EMAIL)
+        prop = key.split(";", 1)[0].split(".")[-1].upper()
+        if prop == "BEGIN" and value.strip().upper() == "VCARD":
+            card_number += 1
+            card = {}
+        elif prop == "END" and value.strip().upper() == "VCARD":
+            if card is not None:
+                yield card_number, card
+            card = None
+        elif card is None:
+            continue
+        elif prop == "FN":
+            card["name"] = _unescape_vcard(value).strip()
+        elif prop == "N" and "name" not in card:
+            parts = [p.strip() for p in _unescape_vcard(value).split(";")]
+            given = parts[1] if len(parts) > 1 else ""
+            card["name"] = " ".join(p for p in (given, parts[0]) if p)
+        elif prop == "EMAIL" and "email" not in card:
+            card["email"] = value.strip()
+        elif prop == "TEL" and "phone" not in card:
+            card["phone"] = value.strip()
+        elif prop == "NOTE":
+            card["notes"] = _unescape_vcard(value).strip()
+
+
+def import_contacts(
+    db: Session,
+    user_id: int,
+    stream: BinaryIO,
+    fmt: str = "csv",
+    progress: Optional[Callable[[int], None]] = None,
+) -> dict:
+    parser = parse_vcard if fmt == "vcard" else parse_csv
+
+    # Load only the dedup keys of existing contacts, not whole rows
+    seen_emails = set()
+    seen_phones = set()
+    existing = db.query(models.Contact.email, models.Contact.phone).filter(models.Contact.user_id == user_id)
+    for email, phone in existing.yield_per(EXPORT_BATCH_SIZE):
+        if normalize_email(email):
+            seen_emails.add(normalize_email(email))
+        if normalize_phone(phone):
+            seen_phones.add(normalize_phone(phone))
+
+    imported = 0
+    duplicates = 0
+    errors = 0
+    processed = 0
+    rows = []
+    batch = []
+
+    def report(row_number, status, error=None):
+        if len(rows) < MAX_REPORTED_ROWS:
+            entry = {"row": row_number, "status": status}
+            if error:
+                entry["error"] = error
+            rows.append(entry)
+
+    def flush():
+        nonlocal imported
+        if batch:
+            db.execute(insert(models.Contact), batch)
+            imported += len(batch)
+            batch.clear()
+        if progress:
+            progress(processed)
+        db.commit()
+
+    try:
+        for row_number, data in parser(stream):
+            processed += 1
+            email = normalize_email(data.get("email"))
+            phone = normalize_phone(data.get("phone"))
+            name = data.get("name") or data.get("email")
+            if not name:
+                errors += 1
+                report(row_number, "error", "Missing name")
+                continue
+            if (email and email in seen_emails) or (phone and phone in seen_phones):
+                duplicates += 1
+                report(row_number, "duplicate")
+                continue
+            if email:
+                seen_emails.add(email)
+            if phone:
+                seen_phones.add(phone)
+
+            batch.append({
+                "name": name,
+                "email": data.get("email") or None,
+                "phone": data.get("phone") or None,
+                "notes": data.get("notes") or None,
+                "user_id": user_id,
+            })
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                flush()
+    except (UnicodeDecodeError, csv.Error) as e:
+        # Keep what was already committed and report where parsing stopped
+        flush()
+        raise ImportFormatError(f"Could not parse file after {processed} rows: {e}")
+
+    flush()
+    return {
+        "ok": True,
+        "processed": processed,
+        "imported": imported,
+        "duplicates": duplicates,
+        "errors": errors,
+        "rows": rows,
+    }
+
+
+def _contact_record(c):
+    return {"id": c.id, "name": c.name, "email": c.email, "phone": c.phone, "notes": c.notes}
+
+
+def _event_record(e):
+    return {"id": e.id, "name": e.name, "date": e.date, "description": e.description}
+
+
+def _recipient_record(r):
+    return {"id": r.id, "event_id": r.event_id, "contact_id": r.contact_id, "budget_limit": r.budget_limit, "notes": r.notes}
+
+
+def _gift_record(g):
+    return {
+        "id": g.id, "event_recipient_id": g.event_recipient_id, "name": g.name, "description": g.description,
+        "amount": g.amount, "purchased": g.purchased, "url": g.url,
+    }
+
+
+def _archived_record(row):
+    # One archived event with its recipients and gifts nested, in the same shape as the live records
+    document = archive.load(row)
+    event = document["event"]
+    return {
+        **{key: event[key] for key in ("id", "name", "date", "description")},
+        "archived_at": row.archived_at,
+        "recipients": [
+            {
+                "id": r["id"], "event_id": event["id"], "contact_id": r["contact_id"], "budget_limit": r["budget_limit"], "notes": r["notes"],
+                "gifts": [{**g, "event_recipient_id": r["id"]} for g in r["gifts"]],
+            }
+            for r in document["recipients"]
+        ],
+    }
+
+
+def _csv_rows(record_type: str, record: Dict) -> Iterator[Tuple[str, Dict]]:
+    # CSV is flat: an archived event becomes archived_event, archived_recipient and archived_gift rows
+    yield record_type, record
+    for recipient in record.get("recipients", ()):
+        yield "archived_recipient", recipient
+        for gift in recipient["gifts"]:
+            yield "archived_gift", gift
+
+
+def _export_sections(db: Session, user_id: int):
+    contacts = db.query(models.Contact).filter(models.Contact.user_id == user_id).order_by(models.Contact.id)
+    events = db.query(models.Event).filter(models.Event.user_id == user_id).order_by(models.Event.id)
+    recipients = db.query(models.EventRecipient).join(models.Event).filter(
+        models.Event.user_id == user_id
+    ).order_by(models.EventRecipient.id)
+    gifts = db.query(models.Gift).join(models.EventRecipient).join(models.Event).filter(
+        models.Event.user_id == user_id
+    ).order_by(models.Gift.id)
+    archived = db.query(models.ArchivedEvent).filter(models.ArchivedEvent.user_id == user_id).order_by(models.ArchivedEvent.id)
+    return [
+        ("contacts", "contact", contacts, _contact_record),
+        ("events", "event", events, _event_record),
+        ("recipients", "recipient", recipients, _recipient_record),
+        ("gifts", "gift", gifts, _gift_record),
+        ("archived_events", "archived_event", archived, _archived_record),
+    ]
+
+
+def export_json(session_factory, user_id: int) -> Iterator[str]:
+    # The generator owns its session: it outlives the request handler
+    db = session_factory()
+    try:
+        yield "{"
+        for index, (section, _, query, to_record) in enumerate(_export_sections(db, user_id)):
+            yield ("," if index else "") + json.dumps(section) + ":["
+            first = True
+            for obj in query.yield_per(EXPORT_BATCH_SIZE):
+                yield ("" if first else ",") + json.dumps(to_record(obj), default=str)
+                first = False
+            yield "]"
+        yield "}"
+    finally:
+        db.close()
+
+
+def export_csv(session_factory, user_id: int) -> Iterator[str]:
+    db = session_factory()
+    try:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_CSV_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        for _, record_type, query, to_record in _export_sections(db, user_id):
+            for obj in query.yield_per(EXPORT_BATCH_SIZE):
+                for row_type, record in _csv_rows(record_type, to_record(obj)):
+                    writer.writerow({"record_type": row_type, **record})
+                if buffer.tell() >= 64 * 1024:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+        yield buffer.getvalue()
+    finally:
+        db.close()
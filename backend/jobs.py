@@ -0,0 +1,369 @@
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Optional
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+import models
+import operations
+import importexport
+import archive
+import pubsub
+from database import SessionLocal, get_engine
+
+# Embedded job queue: the jobs table is the queue, so no external broker is needed.
+# Workers run as threads inside the web process (JOB_WORKERS) or standalone via `python jobs.py`.
+
+logger = logging.getLogger("jobs")
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+# A running job whose worker process hasn't sent a heartbeat for this long is requeued
+JOB_TIMEOUT_SECONDS = int(os.getenv("JOB_TIMEOUT_SECONDS", "900"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+JOB_FILES_DIR = os.getenv("JOB_FILES_DIR", os.path.join(tempfile.gettempdir(), "gift-planner-jobs"))
+
+HANDLERS: Dict[str, Callable] = {}
+
+_wakeup = threading.Event()
+_stopping = threading.Event()
+_threads = []
+_heartbeat = None
+_worker_prefix = None
+
+
+def handler(kind: str):
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(db: Session, user_id: int, kind: str, payload: dict, priority: int = 0, max_attempts: int = 3) -> models.Job:
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = models.Job(
+        user_id=user_id,
+        kind=kind,
+        payload=json.dumps(payload),
+        priority=priority,
+        max_attempts=max_attempts,
+        run_at=datetime.utcnow()
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _wakeup.set()
+    return job
+
+
+def save_upload(stream, suffix: str = "") -> str:
+    # Uploads are spooled to disk so the worker can read them after the request ends
+    os.makedirs(JOB_FILES_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=JOB_FILES_DIR, suffix=suffix)
+    with os.fdopen(fd, "wb") as out:
+        while True:
+            chunk = stream.read(64 * 1024)
+            if not chunk:
+                break
+            out.write(chunk)
+    return path
+
+
+def claim_next(db: Session, worker_id: str) -> Optional[models.Job]:
+    now = datetime.utcnow()
+    query = db.query(models.Job).filter(
+        models.Job.status == models.JobStatus.QUEUED.value,
+        models.Job.run_at <= now
+    ).order_by(models.Job.priority.desc(), models.Job.id)
+
+    if db.bind.dialect.name == "postgresql":
+        job = query.with_for_update(skip_locked=True).first()
+        if not job:
+            db.rollback()
+            return None
+        job.status = models.JobStatus.RUNNING.value
+        job.locked_by = worker_id
+        job.started_at = now
+        job.heartbeat_at = now
+        job.attempts += 1
+        db.commit()
+        # The commit expired it, and the caller detaches it before running
+        db.refresh(job)
+        return job
+
+    # SQLite has no row locks; claim with a conditional update and retry if another worker won
+    for _ in range(5):
+        candidate = query.with_entities(models.Job.id).first()
+        if not candidate:
+            return None
+        claimed = db.execute(
+            update(models.Job)
+            .where(models.Job.id == candidate.id, models.Job.status == models.JobStatus.QUEUED.value)
+            .values(
+                status=models.JobStatus.RUNNING.value,
+                locked_by=worker_id,
+                started_at=now,
+                heartbeat_at=now,
+                attempts=models.Job.attempts + 1
+            )
+        ).rowcount
+        db.commit()
+        if claimed:
+            return db.query(models.Job).filter(models.Job.id == candidate.id).first()
+    return None
+
+
+def _progress_updater(db: Session, job_id: int):
+    # Progress is written through the handler's own session (a second connection would deadlock
+    # on SQLite's database lock), so it becomes visible when the handler commits. Handlers that
+    # commit per batch report as they go; clone_event and delete_event run in one transaction
+    # so they never leave half an event, and their progress appears only once they finish.
+    def update_progress(done: int, total: Optional[int] = None):
+        values = {"progress": done, "heartbeat_at": datetime.utcnow()}
+        if total is not None:
+            values["total"] = total
+        db.execute(update(models.Job).where(models.Job.id == job_id).values(**values))
+    return update_progress
+
+
+def _execute(db: Session, job: models.Job) -> Dict:
+    # Runs the handler and returns the columns recording its outcome
+    try:
+        func = HANDLERS.get(job.kind)
+        if func is None:
+            raise ValueError(f"Unknown job kind: {job.kind}")
+        payload = json.loads(job.payload or "{}")
+        result = func(db, job, payload, _progress_updater(db, job.id))
+        final = {
+            "status": models.JobStatus.SUCCEEDED.value,
+            "result": json.dumps(result),
+            "error": None,
+            "finished_at": datetime.utcnow()
+        }
+    except Exception as e:
+        db.rollback()
+        logger.exception("Job %s (%s) failed", job.id, job.kind)
+        # ValueError means bad input (missing event, unparseable file): retrying won't help
+        if job.attempts < job.max_attempts and not isinstance(e, ValueError):
+            # Exponential backoff: 2s, 4s, 8s, ...
+            final = {
+                "status": models.JobStatus.QUEUED.value,
+                "error": str(e),
+                "locked_by": None,
+                "run_at": datetime.utcnow() + timedelta(seconds=2 ** job.attempts)
+            }
+        else:
+            final = {
+                "status": models.JobStatus.FAILED.value,
+                "error": str(e),
+                "finished_at": datetime.utcnow()
+            }
+            cleanup = getattr(HANDLERS.get(job.kind), "cleanup", None)
+            if cleanup:
+                try:
+                    cleanup(json.loads(job.payload or "{}"))
+                except Exception:
+                    logger.exception("Cleanup after job %s failed", job.id)
+    return final
+
+
+def run_job(job: models.Job):
+    db = SessionLocal()
+    db.info["user_id"] = job.user_id
+    try:
+        final = _execute(db, job)
+        # Only while still ours: a job requeued at shutdown or as stale may already run elsewhere
+        db.execute(update(models.Job).where(models.Job.id == job.id, models.Job.locked_by == job.locked_by).values(**final))
+        db.commit()
+    finally:
+        db.close()
+
+
+def requeue_stale_jobs(db: Session):
+    # Jobs whose worker died mid-run go back to the queue. Jobs still running elsewhere keep
+    # getting heartbeats, however long they take.
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_TIMEOUT_SECONDS)
+    db.execute(
+        update(models.Job)
+        .where(
+            models.Job.status == models.JobStatus.RUNNING.value,
+            func.coalesce(models.Job.heartbeat_at, models.Job.started_at) < cutoff
+        )
+        .values(status=models.JobStatus.QUEUED.value, locked_by=None, run_at=datetime.utcnow())
+    )
+    db.commit()
+
+
+def heartbeat_loop(prefix: str):
+    # One connection per process marks every job its workers are running as alive. The
+    # handlers' own transactions can't do it: single-transaction jobs commit only at the end.
+    while not _stopping.wait(JOB_HEARTBEAT_SECONDS):
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(models.Job)
+                .where(models.Job.status == models.JobStatus.RUNNING.value, models.Job.locked_by.like(f"{prefix}:%"))
+                .values(heartbeat_at=datetime.utcnow())
+            )
+            db.commit()
+        except Exception:
+            # E.g. SQLite locked by a running job; the next beat tries again
+            logger.warning("Job heartbeat failed", exc_info=True)
+        finally:
+            db.close()
+
+
+def requeue_claimed_jobs(db: Session, prefix: str) -> int:
+    # Jobs this process's workers are still running when it stops (recycling, deploys) go back to
+    # the queue now instead of after JOB_TIMEOUT_SECONDS. The interrupted run doesn't count as an attempt.
+    requeued = db.execute(
+        update(models.Job)
+        .where(models.Job.status == models.JobStatus.RUNNING.value, models.Job.locked_by.like(f"{prefix}:%"))
+        .values(status=models.JobStatus.QUEUED.value, locked_by=None, run_at=datetime.utcnow(), attempts=models.Job.attempts - 1)
+    ).rowcount
+    db.commit()
+    return requeued
+
+
+def worker_loop(worker_id: str):
+    while not _stopping.is_set():
+        db = SessionLocal()
+        try:
+            job = claim_next(db, worker_id)
+            if job:
+                db.expunge(job)
+        except Exception:
+            logger.exception("Worker %s could not claim a job", worker_id)
+            job = None
+        finally:
+            db.close()
+
+        if job:
+            try:
+                run_job(job)
+            except Exception:
+                # Recording the outcome failed; the job is requeued once it counts as stale
+                logger.exception("Worker %s could not finish job %s", worker_id, job.id)
+            continue
+
+        _wakeup.wait(JOB_POLL_INTERVAL)
+        _wakeup.clear()
+
+
+def start_workers(count: int = JOB_WORKERS):
+    global _heartbeat, _worker_prefix
+    if _threads or count <= 0:
+        return
+    _stopping.clear()
+    db = SessionLocal()
+    try:
+        requeue_stale_jobs(db)
+    finally:
+        db.close()
+    _worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+    for i in range(count):
+        thread = threading.Thread(target=worker_loop, args=(f"{_worker_prefix}:{i}",), name=f"job-worker-{i}", daemon=True)
+        thread.start()
+        _threads.append(thread)
+    _heartbeat = threading.Thread(target=heartbeat_loop, args=(_worker_prefix,), name="job-heartbeat", daemon=True)
+    _heartbeat.start()
+
+
+def stop_workers(timeout: float = 10):
+    # Running jobs get `timeout` seconds in total to finish; the threads are daemons and die with the process
+    global _heartbeat
+    _stopping.set()
+    _wakeup.set()
+    deadline = time.monotonic() + timeout
+    for thread in _threads:
+        thread.join(max(0, deadline - time.monotonic()))
+    if _threads and any(thread.is_alive() for thread in _threads):
+        db = SessionLocal()
+        try:
+            requeued = requeue_claimed_jobs(db, _worker_prefix)
+            if requeued:
+                logger.warning("Requeued %d job(s) still running at shutdown", requeued)
+        except Exception:
+            logger.exception("Could not requeue running jobs; they will be retried after JOB_TIMEOUT_SECONDS")
+        finally:
+            db.close()
+    _threads.clear()
+    if _heartbeat is not None:
+        _heartbeat.join(max(0, deadline - time.monotonic()))
+        _heartbeat = None
+
+
+# Job handlers
+
+@handler("share_contacts_bulk")
+def share_contacts_bulk_job(db, job, payload, progress):
+    shared_count = operations.share_contacts(
+        db, job.user_id, payload["contact_ids"], payload["shared_with_user_id"], payload.get("permission", "read"), progress
+    )
+    return {"shared_count": shared_count}
+
+
+@handler("clone_event")
+def clone_event_job(db, job, payload, progress):
+    event = operations.clone_event(db, payload["event_id"], job.user_id, payload.get("name"), payload.get("include_gifts", True), progress)
+    if not event:
+        raise ValueError("Event not found")
+    return {"event_id": event.id}
+
+
+@handler("delete_event")
+def delete_event_job(db, job, payload, progress):
+    if not operations.delete_event(db, payload["event_id"], job.user_id, progress):
+        raise ValueError("Event not found")
+    pubsub.publish(payload["event_id"], "event.deleted")
+    return {"ok": True}
+
+
+@handler("archive_events")
+def archive_events_job(db, job, payload, progress):
+    before = date.fromisoformat(payload["before"]) if payload.get("before") else None
+    archived = archive.archive_events(db, job.user_id, before=before, event_ids=payload.get("event_ids"), progress=progress)
+    for event_id in archived:
+        pubsub.publish(event_id, "event.archived")
+    return {"archived": len(archived)}
+
+
+@handler("restore_events")
+def restore_events_job(db, job, payload, progress):
+    restored = archive.restore_events(db, job.user_id, payload["event_ids"], progress)
+    return {"restored": len(restored), "event_ids": list(restored.values())}
+
+
+@handler("import_contacts")
+def import_contacts_job(db, job, payload, progress):
+    with open(payload["path"], "rb") as f:
+        result = importexport.import_contacts(db, job.user_id, f, payload.get("format", "csv"), progress)
+    os.remove(payload["path"])
+    return result
+
+
+def _remove_import_file(payload):
+    if os.path.exists(payload.get("path", "")):
+        os.remove(payload["path"])
+
+
+import_contacts_job.cleanup = _remove_import_file
+
+
+if __name__ == "__main__":
+    # Standalone worker process: run with JOB_WORKERS=0 on the web process
+    logging.basicConfig(level=logging.INFO)
+    get_engine()
+    start_workers(max(JOB_WORKERS, 1))
+    logger.info("Job workers running; press Ctrl+C to stop")
+    try:
+        while True:
+            _stopping.wait(3600)
+    except KeyboardInterrupt:
+        stop_workers()
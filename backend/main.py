@@ -1,17 +1,54 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, status, UploadFile, File, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import or_
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Optional, Union
 import models
 import schemas
 import auth
-from database import SessionLocal, engine
+import importexport
+import analytics
+import archive
+import friendgraph
+import operations
+import jobs
+import pubsub
+import ratelimit
+import idempotency
+import database
+import migrations
+from database import SessionLocal
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+import asyncio
+import json
 import os
 
-models.Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="Gift Planner API")
+# Schema changes run via `python migrate.py upgrade` once per deploy. The local SQLite
+# database is migrated on startup for convenience.
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "true" if database.SQLALCHEMY_DATABASE_URL.startswith("sqlite") else "false").lower() == "true"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    engine = database.get_engine()
+    if AUTO_MIGRATE:
+        migrations.upgrade(engine)
+    else:
+        # Code that expects a missing column fails on every request that touches it; say why up front
+        missing = migrations.pending(engine)
+        if missing:
+            print(f"⚠️  {len(missing)} pending migration(s): {', '.join(f'{v}_{n}' for v, n in missing)}. Run `python migrate.py upgrade`.")
+    jobs.start_workers()
+    pubsub.start(engine)
+    friendgraph.graph.warm()
+    yield
+    jobs.stop_workers()
+    pubsub.stop()
+    database.dispose_engine()
+
+app = FastAPI(title="Gift Planner API", lifespan=lifespan)
 
 # CORS middleware - allow frontend origins
 allowed_origins_str = os.getenv('ALLOWED_ORIGINS', 'http://localhost:5173,http://localhost:3000')
@@ -20,6 +57,11 @@ allowed_origins = [origin.strip() for origin in allowed_origins_str.split(',')]
 print(f"🔧 ALLOWED_ORIGINS from env: {allowed_origins_str}")
 print(f"🔧 ALLOWED_ORIGINS used: {allowed_origins}")
 
+# Rate limiting sits inside CORS so 429/503 responses still carry CORS headers
+app.add_middleware(ratelimit.RateLimitMiddleware)
+# Outside rate limiting, so replayed retries don't spend the client's budget
+app.add_middleware(idempotency.IdempotencyMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
@@ -29,6 +71,7 @@ app.add_middleware(
 )
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
 # Dependency
 def get_db():
@@ -44,11 +87,22 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    # Verified from the token's claims; the DB is only consulted on a token-version cache miss
     user = auth.verify_token(token, db)
     if user is None:
         raise credentials_exception
+    # Lets commits on this session keep the user's reads on the primary for a while
+    db.info["user_id"] = user.id
     return user
 
+def get_read_db(current_user: auth.CurrentUser = Depends(get_current_user)):
+    # Session for read-only handlers; queries go to a replica when one is configured
+    db = database.read_session(current_user.id)
+    try:
+        yield db
+    finally:
+        db.close()
+
 # Health check endpoint
 @app.get("/")
 def health_check():
@@ -75,38 +129,88 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = auth.create_access_token(data={"sub": user.username})
-    return {"access_token": access_token, "token_type": "bearer"}
+    return auth.create_token_pair(user)
+
+@app.post("/token/refresh", response_model=schemas.Token)
+def refresh_token(body: schemas.TokenRefresh, db: Session = Depends(get_db)):
+    tokens = auth.refresh_tokens(db, body.refresh_token)
+    if tokens is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return tokens
+
+@app.post("/logout")
+def logout(body: schemas.Logout, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
+    auth.revoke_token(db, token, "access")
+    if body.refresh_token:
+        auth.revoke_token(db, body.refresh_token, "refresh")
+    return {"ok": True}
+
+@app.post("/logout/all")
+def logout_all(db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
+    auth.revoke_all_sessions(db, current_user.id)
+    return {"ok": True}
 
 @app.get("/users/me", response_model=schemas.User)
-async def read_users_me(current_user: models.User = Depends(get_current_user)):
-    return current_user
+def read_users_me(db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
+    user = db.query(models.User).filter(models.User.id == current_user.id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
 
 # Contact endpoints
 @app.post("/contacts", response_model=schemas.Contact)
-def create_contact(contact: schemas.ContactCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def create_contact(contact: schemas.ContactCreate, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     db_contact = models.Contact(**contact.dict(), user_id=current_user.id)
     db.add(db_contact)
     db.commit()
     db.refresh(db_contact)
     return db_contact
 
-@app.get("/contacts", response_model=List[schemas.Contact])
-def read_contacts(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    # Get own contacts
-    own_contacts = db.query(models.Contact).filter(models.Contact.user_id == current_user.id).all()
-    
-    # Get contacts shared with user
-    shared_contacts = db.query(models.Contact).join(models.ContactShare).filter(
-        models.ContactShare.shared_with_user_id == current_user.id
-    ).all()
-    
-    # Combine and return unique contacts
-    all_contacts = own_contacts + shared_contacts
-    return all_contacts[skip:skip+limit]
+@app.get("/contacts", response_model=Union[List[schemas.ContactWithShares], List[schemas.Contact]])
+def read_contacts(
+    skip: int = 0,
+    limit: int = 100,
+    include: Optional[str] = Query(None, pattern="^shares$"),
+    db: Session = Depends(get_read_db),
+    current_user: auth.CurrentUser = Depends(get_current_user)
+):
+    shared_ids = db.query(models.ContactShare.contact_id).filter(models.ContactShare.shared_with_user_id == current_user.id)
+    contacts = db.query(models.Contact).filter(
+        or_(models.Contact.user_id == current_user.id, models.Contact.id.in_(shared_ids))
+    ).order_by(models.Contact.id).offset(skip).limit(limit).all()
+    if include != "shares":
+        return [schemas.Contact.model_validate(c) for c in contacts]
+    shares = shares_by_item(db, models.ContactShare, models.ContactShare.contact_id, contacts, current_user.id)
+    return [
+        schemas.ContactWithShares(
+            **schemas.Contact.model_validate(c).model_dump(),
+            shares=shares.get(c.id, []),
+            is_owner=c.user_id == current_user.id
+        )
+        for c in contacts
+    ]
+
+@app.post("/contacts/import", response_model=Union[schemas.ContactImportResult, schemas.JobCreated])
+def import_contacts(response: Response, file: UploadFile = File(...), format: Optional[str] = None, background: bool = False, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
+    fmt = format or importexport.detect_format(file.filename, file.content_type)
+    if fmt not in ("csv", "vcard"):
+        raise HTTPException(status_code=400, detail="format must be 'csv' or 'vcard'")
+    if background:
+        path = jobs.save_upload(file.file)
+        job = jobs.enqueue(db, current_user.id, "import_contacts", {"path": path, "format": fmt})
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"job_id": job.id, "status": job.status}
+    try:
+        return importexport.import_contacts(db, current_user.id, file.file, fmt)
+    except importexport.ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.put("/contacts/{contact_id}", response_model=schemas.Contact)
-def update_contact(contact_id: int, contact: schemas.ContactCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def update_contact(contact_id: int, contact: schemas.ContactCreate, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     db_contact = db.query(models.Contact).filter(models.Contact.id == contact_id, models.Contact.user_id == current_user.id).first()
     if not db_contact:
         raise HTTPException(status_code=404, detail="Contact not found")
@@ -117,7 +221,7 @@ def update_contact(contact_id: int, contact: schemas.ContactCreate, db: Session
     return db_contact
 
 @app.delete("/contacts/{contact_id}")
-def delete_contact(contact_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def delete_contact(contact_id: int, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     db_contact = db.query(models.Contact).filter(models.Contact.id == contact_id, models.Contact.user_id == current_user.id).first()
     if not db_contact:
         raise HTTPException(status_code=404, detail="Contact not found")
@@ -127,32 +231,94 @@ def delete_contact(contact_id: int, db: Session = Depends(get_db), current_user:
 
 # Event endpoints
 @app.post("/events", response_model=schemas.Event)
-def create_event(event: schemas.EventCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def create_event(event: schemas.EventCreate, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     db_event = models.Event(**event.dict(), user_id=current_user.id)
     db.add(db_event)
     db.commit()
     db.refresh(db_event)
     return db_event
 
-@app.get("/events", response_model=List[schemas.Event])
-def read_events(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    # Get own events
-    own_events = db.query(models.Event).filter(models.Event.user_id == current_user.id).all()
-    
-    # Get events shared with user
-    shared_events = db.query(models.Event).join(models.EventShare).filter(
-        models.EventShare.shared_with_user_id == current_user.id
-    ).all()
-    
-    # Combine and return unique events
-    all_events = own_events + shared_events
-    return all_events[skip:skip+limit]
+def shares_by_item(db: Session, share_model, item_column, items, user_id: int):
+    # Shares for the owned items of one page, in two queries (shares, then their users) however large the page.
+    # Recipients of a share don't get to see who else it was shared with.
+    owned_ids = [item.id for item in items if item.user_id == user_id]
+    grouped = {}
+    if owned_ids:
+        rows = db.query(share_model).options(selectinload(share_model.shared_with)).filter(
+            item_column.in_(owned_ids)
+        ).order_by(share_model.id)
+        for share in rows:
+            grouped.setdefault(getattr(share, item_column.key), []).append(share)
+    return grouped
+
+def visible_events(db: Session, user_id: int):
+    # Own events plus events shared with the user, as one query so filters and paging run in SQL
+    shared_ids = db.query(models.EventShare.event_id).filter(models.EventShare.shared_with_user_id == user_id)
+    return db.query(models.Event).filter(or_(models.Event.user_id == user_id, models.Event.id.in_(shared_ids)))
+
+@app.get("/events", response_model=Union[List[schemas.EventWithShares], List[schemas.Event]])
+def read_events(
+    skip: int = 0,
+    limit: int = 100,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    order: Optional[str] = Query(None, pattern="^(date|id)$"),
+    include: Optional[str] = Query(None, pattern="^shares$"),
+    db: Session = Depends(get_read_db),
+    current_user: auth.CurrentUser = Depends(get_current_user)
+):
+    query = visible_events(db, current_user.id)
+    if date_from:
+        query = query.filter(models.Event.date >= date_from)
+    if date_to:
+        query = query.filter(models.Event.date <= date_to)
+    if order == "date":
+        # Undated events sort last
+        query = query.order_by(models.Event.date.is_(None), models.Event.date, models.Event.id)
+    else:
+        query = query.order_by(models.Event.id)
+    events = query.offset(skip).limit(limit).all()
+    if include != "shares":
+        return [schemas.Event.model_validate(e) for e in events]
+    shares = shares_by_item(db, models.EventShare, models.EventShare.event_id, events, current_user.id)
+    return [
+        schemas.EventWithShares(
+            **schemas.Event.model_validate(e).model_dump(),
+            shares=shares.get(e.id, []),
+            is_owner=e.user_id == current_user.id
+        )
+        for e in events
+    ]
+
+# Declared before /events/{event_id} so "upcoming" isn't parsed as an id
+@app.get("/events/upcoming", response_model=List[schemas.Event])
+def read_upcoming_events(
+    limit: int = Query(10, ge=1, le=100),
+    days: Optional[int] = Query(None, ge=0),
+    db: Session = Depends(get_read_db),
+    current_user: auth.CurrentUser = Depends(get_current_user)
+):
+    today = date.today()
+    query = visible_events(db, current_user.id).filter(models.Event.date >= today)
+    if days is not None:
+        query = query.filter(models.Event.date <= today + timedelta(days=days))
+    return query.order_by(models.Event.date, models.Event.id).limit(limit).all()
+
+@app.get("/events/archived", response_model=List[schemas.ArchivedEvent])
+def read_archived_events(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db), current_user: auth.CurrentUser = Depends(get_current_user)):
+    return db.query(models.ArchivedEvent).filter(
+        models.ArchivedEvent.user_id == current_user.id
+    ).order_by(models.ArchivedEvent.date.desc(), models.ArchivedEvent.id).offset(skip).limit(limit).all()
 
 @app.get("/events/{event_id}", response_model=schemas.EventDetail)
-def read_event(event_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def read_event(event_id: int, db: Session = Depends(get_read_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     # Check if user owns the event
     event = db.query(models.Event).filter(models.Event.id == event_id).first()
     if not event:
+        # Archived events are read on demand from their stored copy
+        document = archive.get_archived(db, event_id, current_user.id)
+        if document:
+            return archive.detail(document)
         raise HTTPException(status_code=404, detail="Event not found")
     
     # Check if user has access (owner or shared with)
@@ -167,40 +333,97 @@ def read_event(event_id: int, db: Session = Depends(get_db), current_user: model
     return event
 
 @app.put("/events/{event_id}", response_model=schemas.Event)
-def update_event(event_id: int, event: schemas.EventCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def update_event(event_id: int, event: schemas.EventCreate, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     db_event = db.query(models.Event).filter(models.Event.id == event_id, models.Event.user_id == current_user.id).first()
     if not db_event:
         raise HTTPException(status_code=404, detail="Event not found")
+    # A new date can move the event's spending to another year
+    before = analytics.snapshot(db, event_id=event_id) if event.date != db_event.date else None
     for key, value in event.dict().items():
         setattr(db_event, key, value)
+    if before is not None:
+        analytics.record_change(db, before, analytics.snapshot(db, event_id=event_id))
     db.commit()
     db.refresh(db_event)
+    pubsub.publish(event_id, "event.updated", schemas.Event.model_validate(db_event))
     return db_event
 
 @app.delete("/events/{event_id}")
-def delete_event(event_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    db_event = db.query(models.Event).filter(models.Event.id == event_id, models.Event.user_id == current_user.id).first()
-    if not db_event:
+def delete_event(event_id: int, response: Response, background: bool = False, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
+    if background:
+        # Same events the inline path deletes: live or archived, owned by the caller
+        if not operations.owns_event(db, event_id, current_user.id):
+            raise HTTPException(status_code=404, detail="Event not found")
+        job = jobs.enqueue(db, current_user.id, "delete_event", {"event_id": event_id})
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"job_id": job.id, "status": job.status}
+
+    if not operations.delete_event(db, event_id, current_user.id):
         raise HTTPException(status_code=404, detail="Event not found")
-    db.delete(db_event)
-    db.commit()
+    pubsub.publish(event_id, "event.deleted")
+    return {"ok": True}
+
+@app.post("/events/{event_id}/clone", response_model=schemas.JobCreated, status_code=status.HTTP_202_ACCEPTED)
+def clone_event(event_id: int, clone: schemas.EventClone, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
+    event = db.query(models.Event).filter(models.Event.id == event_id, models.Event.user_id == current_user.id).first()
+    if not event:
+        raise HTTPException(status_code=404, detail="Event not found")
+    job = jobs.enqueue(db, current_user.id, "clone_event", {
+        "event_id": event_id,
+        "name": clone.name,
+        "include_gifts": clone.include_gifts
+    }, priority=clone.priority)
+    return {"job_id": job.id, "status": job.status}
+
+# Archive endpoints
+@app.post("/events/archive", response_model=schemas.JobCreated, status_code=status.HTTP_202_ACCEPTED)
+def archive_events(request: schemas.EventArchive, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
+    before = request.before if request.event_ids is not None or request.before else archive.default_cutoff()
+    job = jobs.enqueue(db, current_user.id, "archive_events", {
+        "event_ids": request.event_ids,
+        "before": before.isoformat() if before else None
+    })
+    return {"job_id": job.id, "status": job.status}
+
+@app.post("/events/restore", response_model=schemas.JobCreated, status_code=status.HTTP_202_ACCEPTED)
+def restore_events(request: schemas.EventRestore, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
+    job = jobs.enqueue(db, current_user.id, "restore_events", {"event_ids": request.event_ids})
+    return {"job_id": job.id, "status": job.status}
+
+@app.post("/events/{event_id}/archive")
+def archive_event(event_id: int, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
+    if not archive.archive_events(db, current_user.id, event_ids=[event_id]):
+        if db.query(models.Event.id).filter(models.Event.id == event_id, models.Event.user_id == current_user.id).first():
+            raise HTTPException(status_code=409, detail="An archived event already has this id")
+        raise HTTPException(status_code=404, detail="Event not found")
+    pubsub.publish(event_id, "event.archived")
     return {"ok": True}
 
+@app.post("/events/{event_id}/restore", response_model=schemas.Event)
+def restore_event(event_id: int, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
+    restored = archive.restore_events(db, current_user.id, [event_id])
+    if not restored:
+        raise HTTPException(status_code=404, detail="Archived event not found")
+    return db.query(models.Event).filter(models.Event.id == restored[event_id]).first()
+
 # Event Recipient endpoints
 @app.post("/events/{event_id}/recipients", response_model=schemas.EventRecipient)
-def add_recipient_to_event(event_id: int, recipient: schemas.EventRecipientCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def add_recipient_to_event(event_id: int, recipient: schemas.EventRecipientCreate, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     event = db.query(models.Event).filter(models.Event.id == event_id, models.Event.user_id == current_user.id).first()
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
     
     db_recipient = models.EventRecipient(**recipient.dict(), event_id=event_id)
     db.add(db_recipient)
+    db.flush()
+    analytics.record_change(db, {}, analytics.snapshot(db, recipient_ids=[db_recipient.id]))
     db.commit()
     db.refresh(db_recipient)
+    pubsub.publish(event_id, "recipient.added", schemas.EventRecipientDetail.model_validate(db_recipient))
     return db_recipient
 
 @app.get("/events/{event_id}/recipients", response_model=List[schemas.EventRecipientDetail])
-def read_event_recipients(event_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def read_event_recipients(event_id: int, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     event = db.query(models.Event).filter(models.Event.id == event_id, models.Event.user_id == current_user.id).first()
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
@@ -209,7 +432,7 @@ def read_event_recipients(event_id: int, db: Session = Depends(get_db), current_
     return recipients
 
 @app.put("/events/{event_id}/recipients/{recipient_id}", response_model=schemas.EventRecipient)
-def update_event_recipient(event_id: int, recipient_id: int, recipient: schemas.EventRecipientUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def update_event_recipient(event_id: int, recipient_id: int, recipient: schemas.EventRecipientUpdate, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     event = db.query(models.Event).filter(models.Event.id == event_id, models.Event.user_id == current_user.id).first()
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
@@ -221,14 +444,17 @@ def update_event_recipient(event_id: int, recipient_id: int, recipient: schemas.
     if not db_recipient:
         raise HTTPException(status_code=404, detail="Recipient not found")
     
+    before = analytics.snapshot(db, recipient_ids=[recipient_id])
     for key, value in recipient.dict(exclude_unset=True).items():
         setattr(db_recipient, key, value)
+    analytics.record_change(db, before, analytics.snapshot(db, recipient_ids=[recipient_id]))
     db.commit()
     db.refresh(db_recipient)
+    pubsub.publish(event_id, "recipient.updated", schemas.EventRecipient.model_validate(db_recipient))
     return db_recipient
 
 @app.delete("/events/{event_id}/recipients/{recipient_id}")
-def remove_recipient_from_event(event_id: int, recipient_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def remove_recipient_from_event(event_id: int, recipient_id: int, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     event = db.query(models.Event).filter(models.Event.id == event_id, models.Event.user_id == current_user.id).first()
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
@@ -240,13 +466,16 @@ def remove_recipient_from_event(event_id: int, recipient_id: int, db: Session =
     if not db_recipient:
         raise HTTPException(status_code=404, detail="Recipient not found")
     
+    before = analytics.snapshot(db, recipient_ids=[recipient_id])
     db.delete(db_recipient)
+    analytics.record_change(db, before, analytics.snapshot(db, recipient_ids=[recipient_id]))
     db.commit()
+    pubsub.publish(event_id, "recipient.removed", {"id": recipient_id})
     return {"ok": True}
 
 # Gift endpoints
 @app.post("/recipients/{recipient_id}/gifts", response_model=schemas.Gift)
-def create_gift(recipient_id: int, gift: schemas.GiftCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def create_gift(recipient_id: int, gift: schemas.GiftCreate, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     # First try to find recipient in user's own events
     recipient = db.query(models.EventRecipient).join(models.Event).filter(
         models.EventRecipient.id == recipient_id,
@@ -264,14 +493,17 @@ def create_gift(recipient_id: int, gift: schemas.GiftCreate, db: Session = Depen
     if not recipient:
         raise HTTPException(status_code=404, detail="Recipient not found or you don't have permission")
     
+    before = analytics.snapshot(db, recipient_ids=[recipient_id])
     db_gift = models.Gift(**gift.dict(), event_recipient_id=recipient_id)
     db.add(db_gift)
+    analytics.record_change(db, before, analytics.snapshot(db, recipient_ids=[recipient_id]))
     db.commit()
     db.refresh(db_gift)
+    pubsub.publish(recipient.event_id, "gift.created", schemas.Gift.model_validate(db_gift))
     return db_gift
 
 @app.get("/recipients/{recipient_id}/gifts", response_model=List[schemas.Gift])
-def read_gifts(recipient_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def read_gifts(recipient_id: int, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     recipient = db.query(models.EventRecipient).join(models.Event).filter(
         models.EventRecipient.id == recipient_id,
         models.Event.user_id == current_user.id
@@ -283,7 +515,7 @@ def read_gifts(recipient_id: int, db: Session = Depends(get_db), current_user: m
     return gifts
 
 @app.put("/gifts/{gift_id}", response_model=schemas.Gift)
-def update_gift(gift_id: int, gift: schemas.GiftUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def update_gift(gift_id: int, gift: schemas.GiftUpdate, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     # First try user's own events
     db_gift = db.query(models.Gift).join(models.EventRecipient).join(models.Event).filter(
         models.Gift.id == gift_id,
@@ -301,14 +533,17 @@ def update_gift(gift_id: int, gift: schemas.GiftUpdate, db: Session = Depends(ge
     if not db_gift:
         raise HTTPException(status_code=404, detail="Gift not found or you don't have permission")
     
+    before = analytics.snapshot(db, recipient_ids=[db_gift.event_recipient_id])
     for key, value in gift.dict(exclude_unset=True).items():
         setattr(db_gift, key, value)
+    analytics.record_change(db, before, analytics.snapshot(db, recipient_ids=[db_gift.event_recipient_id]))
     db.commit()
     db.refresh(db_gift)
+    pubsub.publish(db_gift.recipient.event_id, "gift.updated", schemas.Gift.model_validate(db_gift))
     return db_gift
 
 @app.delete("/gifts/{gift_id}")
-def delete_gift(gift_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def delete_gift(gift_id: int, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     # First try user's own events
     db_gift = db.query(models.Gift).join(models.EventRecipient).join(models.Event).filter(
         models.Gift.id == gift_id,
@@ -326,13 +561,18 @@ def delete_gift(gift_id: int, db: Session = Depends(get_db), current_user: model
     if not db_gift:
         raise HTTPException(status_code=404, detail="Gift not found or you don't have permission")
     
+    event_id = db_gift.recipient.event_id
+    recipient_id = db_gift.event_recipient_id
+    before = analytics.snapshot(db, recipient_ids=[recipient_id])
     db.delete(db_gift)
+    analytics.record_change(db, before, analytics.snapshot(db, recipient_ids=[recipient_id]))
     db.commit()
+    pubsub.publish(event_id, "gift.deleted", {"id": gift_id, "event_recipient_id": recipient_id})
     return {"ok": True}
 
 # Friend endpoints
 @app.get("/users/search", response_model=List[schemas.FriendInfo])
-def search_users(q: str, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def search_users(q: str, db: Session = Depends(get_read_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     if len(q) < 2:
         return []
     
@@ -345,7 +585,7 @@ def search_users(q: str, db: Session = Depends(get_db), current_user: models.Use
     return users
 
 @app.post("/friends/request", response_model=schemas.FriendRequest)
-def send_friend_request(request: schemas.FriendRequestCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def send_friend_request(request: schemas.FriendRequestCreate, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     # Find the user to send request to
     to_user = db.query(models.User).filter(models.User.username == request.to_username).first()
     if not to_user:
@@ -373,7 +613,7 @@ def send_friend_request(request: schemas.FriendRequestCreate, db: Session = Depe
     return db_request
 
 @app.get("/friends/requests", response_model=List[schemas.FriendRequest])
-def get_friend_requests(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_friend_requests(db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     requests = db.query(models.FriendRequest).filter(
         models.FriendRequest.to_user_id == current_user.id,
         models.FriendRequest.status == "pending"
@@ -381,7 +621,7 @@ def get_friend_requests(db: Session = Depends(get_db), current_user: models.User
     return requests
 
 @app.post("/friends/requests/{request_id}/accept")
-def accept_friend_request(request_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def accept_friend_request(request_id: int, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     db_request = db.query(models.FriendRequest).filter(
         models.FriendRequest.id == request_id,
         models.FriendRequest.to_user_id == current_user.id
@@ -391,10 +631,11 @@ def accept_friend_request(request_id: int, db: Session = Depends(get_db), curren
     
     db_request.status = "accepted"
     db.commit()
+    friendgraph.graph.add_friendship(db_request.from_user_id, db_request.to_user_id)
     return {"ok": True}
 
 @app.post("/friends/requests/{request_id}/reject")
-def reject_friend_request(request_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def reject_friend_request(request_id: int, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     db_request = db.query(models.FriendRequest).filter(
         models.FriendRequest.id == request_id,
         models.FriendRequest.to_user_id == current_user.id
@@ -407,7 +648,7 @@ def reject_friend_request(request_id: int, db: Session = Depends(get_db), curren
     return {"ok": True}
 
 @app.get("/friends", response_model=List[schemas.FriendInfo])
-def get_friends(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_friends(db: Session = Depends(get_read_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     # Get all accepted friend requests where current user is involved
     friend_requests = db.query(models.FriendRequest).filter(
         ((models.FriendRequest.from_user_id == current_user.id) | (models.FriendRequest.to_user_id == current_user.id)),
@@ -423,9 +664,27 @@ def get_friends(db: Session = Depends(get_db), current_user: models.User = Depen
     
     return friends
 
+@app.get("/friends/suggestions", response_model=List[schemas.FriendSuggestion])
+def get_friend_suggestions(limit: int = Query(10, ge=1, le=50), db: Session = Depends(get_read_db), current_user: auth.CurrentUser = Depends(get_current_user)):
+    # People with pending requests either way are left out; they already know about each other.
+    # So are friends: the graph may not have seen a request accepted on another worker yet.
+    known = db.query(models.FriendRequest.from_user_id, models.FriendRequest.to_user_id).filter(
+        ((models.FriendRequest.from_user_id == current_user.id) | (models.FriendRequest.to_user_id == current_user.id)),
+        models.FriendRequest.status.in_(["pending", "accepted"])
+    )
+    exclude = {user_id for pair in known for user_id in pair}
+    ranked = friendgraph.graph.suggestions(current_user.id, limit, exclude)
+    if not ranked:
+        return []
+    users = {u.id: u for u in db.query(models.User).filter(models.User.id.in_([user_id for user_id, _ in ranked]))}
+    return [
+        schemas.FriendSuggestion(**schemas.FriendInfo.model_validate(users[user_id]).model_dump(), mutual_friends=count)
+        for user_id, count in ranked if user_id in users
+    ]
+
 # Contact sharing endpoints
 @app.post("/contacts/{contact_id}/share")
-def share_contact(contact_id: int, share: schemas.ContactShareCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def share_contact(contact_id: int, share: schemas.ContactShareCreate, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     contact = db.query(models.Contact).filter(
         models.Contact.id == contact_id,
         models.Contact.user_id == current_user.id
@@ -465,7 +724,7 @@ def share_contact(contact_id: int, share: schemas.ContactShareCreate, db: Sessio
     return {"ok": True}
 
 @app.post("/contacts/share/bulk")
-def share_contacts_bulk(share_data: dict, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def share_contacts_bulk(share_data: dict, response: Response, background: bool = False, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     contact_ids = share_data.get("contact_ids", [])
     shared_with_user_id = share_data.get("shared_with_user_id")
     permission = share_data.get("permission", "read")
@@ -483,41 +742,20 @@ def share_contacts_bulk(share_data: dict, db: Session = Depends(get_db), current
     if not is_friend:
         raise HTTPException(status_code=400, detail="Can only share with friends")
     
-    shared_count = 0
-    for contact_id in contact_ids:
-        contact = db.query(models.Contact).filter(
-            models.Contact.id == contact_id,
-            models.Contact.user_id == current_user.id
-        ).first()
-        
-        if not contact:
-            continue
-        
-        # Check if already shared
-        existing = db.query(models.ContactShare).filter(
-            models.ContactShare.contact_id == contact_id,
-            models.ContactShare.shared_with_user_id == shared_with_user_id
-        ).first()
-        
-        if existing:
-            # Update permission
-            existing.permission = permission
-        else:
-            # Create new share
-            db_share = models.ContactShare(
-                contact_id=contact_id,
-                shared_with_user_id=shared_with_user_id,
-                permission=permission
-            )
-            db.add(db_share)
-        
-        shared_count += 1
+    if background:
+        job = jobs.enqueue(db, current_user.id, "share_contacts_bulk", {
+            "contact_ids": contact_ids,
+            "shared_with_user_id": shared_with_user_id,
+            "permission": permission
+        })
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"job_id": job.id, "status": job.status}
     
-    db.commit()
+    shared_count = operations.share_contacts(db, current_user.id, contact_ids, shared_with_user_id, permission)
     return {"ok": True, "shared_count": shared_count}
 
 @app.delete("/contacts/{contact_id}/share/{user_id}")
-def unshare_contact(contact_id: int, user_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def unshare_contact(contact_id: int, user_id: int, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     contact = db.query(models.Contact).filter(
         models.Contact.id == contact_id,
         models.Contact.user_id == current_user.id
@@ -538,7 +776,7 @@ def unshare_contact(contact_id: int, user_id: int, db: Session = Depends(get_db)
 
 # Event sharing endpoints
 @app.post("/events/{event_id}/share")
-def share_event(event_id: int, share: schemas.EventShareCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def share_event(event_id: int, share: schemas.EventShareCreate, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     event = db.query(models.Event).filter(
         models.Event.id == event_id,
         models.Event.user_id == current_user.id
@@ -566,6 +804,7 @@ def share_event(event_id: int, share: schemas.EventShareCreate, db: Session = De
         # Update permission
         existing.permission = share.permission
         db.commit()
+        pubsub.publish(event_id, "share.updated", {"shared_with_user_id": share.shared_with_user_id, "permission": share.permission})
         return {"ok": True, "message": "Permission updated"}
     
     db_share = models.EventShare(
@@ -575,10 +814,11 @@ def share_event(event_id: int, share: schemas.EventShareCreate, db: Session = De
     )
     db.add(db_share)
     db.commit()
+    pubsub.publish(event_id, "share.updated", {"shared_with_user_id": share.shared_with_user_id, "permission": share.permission})
     return {"ok": True}
 
 @app.delete("/events/{event_id}/share/{user_id}")
-def unshare_event(event_id: int, user_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def unshare_event(event_id: int, user_id: int, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
     event = db.query(models.Event).filter(
         models.Event.id == event_id,
         models.Event.user_id == current_user.id
@@ -594,5 +834,114 @@ def unshare_event(event_id: int, user_id: int, db: Session = Depends(get_db), cu
     if share:
         db.delete(share)
         db.commit()
+        pubsub.publish(event_id, "share.removed", {"shared_with_user_id": user_id})
     
     return {"ok": True}
+
+# Live event updates (Server-Sent Events)
+STREAM_KEEPALIVE_SECONDS = 15
+
+def can_stream(db: Session, event_id: int, user_id: int):
+    event = db.query(models.Event).filter(models.Event.id == event_id).first()
+    if not event:
+        raise HTTPException(status_code=404, detail="Event not found")
+    if event.user_id != user_id:
+        share = db.query(models.EventShare).filter(
+            models.EventShare.event_id == event_id,
+            models.EventShare.shared_with_user_id == user_id
+        ).first()
+        if not share:
+            raise HTTPException(status_code=403, detail="Access denied")
+
+@app.post("/events/{event_id}/stream/ticket", response_model=schemas.StreamTicket)
+def create_stream_ticket(event_id: int, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
+    can_stream(db, event_id, current_user.id)
+    return {"ticket": auth.create_stream_ticket(current_user, event_id), "expires_in": auth.STREAM_TICKET_SECONDS}
+
+@app.get("/events/{event_id}/stream")
+def stream_event(event_id: int, request: Request, ticket: Optional[str] = None, token: Optional[str] = Depends(optional_oauth2_scheme)):
+    # EventSource cannot set headers, so browsers pass a single-use ?ticket= from POST .../stream/ticket.
+    # The session is closed before streaming so an open stream doesn't pin a pooled connection.
+    db = SessionLocal()
+    try:
+        user = auth.verify_token(token, db) if token else auth.redeem_stream_ticket(db, ticket or "", event_id)
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        can_stream(db, event_id, user.id)
+        user_id = user.id
+    finally:
+        db.close()
+
+    async def event_stream():
+        subscriber = pubsub.broker.subscribe(event_id)
+        queue = subscriber[1]
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+                # Stop streaming once the event is gone or this user's access is revoked
+                if message["type"] == "event.deleted":
+                    break
+                if message["type"] == "share.removed" and message["data"]["shared_with_user_id"] == user_id:
+                    break
+        finally:
+            pubsub.broker.unsubscribe(event_id, subscriber)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Job endpoints
+@app.get("/jobs", response_model=List[schemas.Job])
+def read_jobs(limit: int = 50, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
+    return db.query(models.Job).filter(models.Job.user_id == current_user.id).order_by(models.Job.id.desc()).limit(limit).all()
+
+@app.get("/jobs/{job_id}", response_model=schemas.Job)
+def read_job(job_id: int, db: Session = Depends(get_db), current_user: auth.CurrentUser = Depends(get_current_user)):
+    job = db.query(models.Job).filter(models.Job.id == job_id, models.Job.user_id == current_user.id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# Export endpoint
+@app.get("/export")
+def export_data(format: str = "json", current_user: auth.CurrentUser = Depends(get_current_user)):
+    if format == "json":
+        return StreamingResponse(
+            importexport.export_json(SessionLocal, current_user.id),
+            media_type="application/json",
+            headers={"Content-Disposition": 'attachment; filename="gift-planner-export.json"'},
+        )
+    if format == "csv":
+        return StreamingResponse(
+            importexport.export_csv(SessionLocal, current_user.id),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="gift-planner-export.csv"'},
+        )
+    raise HTTPException(status_code=400, detail="format must be 'json' or 'csv'")
+
+# Analytics endpoints (served from gift_rollups, see analytics.py)
+@app.get("/analytics/years", response_model=List[schemas.YearSpending])
+def analytics_years(db: Session = Depends(get_read_db), current_user: auth.CurrentUser = Depends(get_current_user)):
+    return analytics.years(db, current_user.id)
+
+@app.get("/analytics/contacts", response_model=List[schemas.ContactYearSpending])
+def analytics_contacts(year: Optional[int] = None, skip: int = 0, limit: int = Query(100, le=1000), db: Session = Depends(get_read_db), current_user: auth.CurrentUser = Depends(get_current_user)):
+    return analytics.contacts(db, current_user.id, year=year, skip=skip, limit=limit)
+
+@app.get("/analytics/contacts/{contact_id}", response_model=List[schemas.ContactYearSpending])
+def analytics_contact(contact_id: int, db: Session = Depends(get_read_db), current_user: auth.CurrentUser = Depends(get_current_user)):
+    return analytics.contacts(db, current_user.id, contact_id=contact_id, limit=1000)
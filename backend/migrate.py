@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+import migrations
+from database import get_engine
+
+# Run once per deploy (Railway preDeployCommand / Procfile release phase):
+#   python migrate.py upgrade
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gift Planner schema migrations")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    upgrade = subcommands.add_parser("upgrade", help="Apply pending migrations")
+    upgrade.add_argument("target", nargs="?", help="Stop after this version (default: latest)")
+    subcommands.add_parser("current", help="Show applied and pending migrations")
+    subcommands.add_parser("history", help="List all migrations")
+    args = parser.parse_args(argv)
+
+    engine = get_engine()
+    if args.command == "upgrade":
+        applied = migrations.upgrade(engine, args.target)
+        print(f"✅ Applied {len(applied)} migration(s)" if applied else "✅ Database is up to date")
+    elif args.command == "current":
+        pending = migrations.pending(engine)
+        applied = [r for r in migrations.revisions() if r not in pending]
+        for version, name in applied:
+            print(f"  applied  {version}_{name}")
+        for version, name in pending:
+            print(f"  pending  {version}_{name}")
+    elif args.command == "history":
+        for version, name in migrations.revisions():
+            print(f"{version}_{name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+from sqlalchemy import Boolean, Column, Float, ForeignKey, Integer, MetaData, String, Table
+
+# Schema as originally created by Base.metadata.create_all. Existing databases
+# already have these tables, so each is created only if missing.
+
+metadata = MetaData()
+
+Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("username", String, unique=True, index=True),
+    Column("email", String, unique=True, index=True),
+    Column("hashed_password", String),
+    Column("full_name", String),
+)
+
+Table(
+    "friend_requests", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("from_user_id", Integer, ForeignKey("users.id")),
+    Column("to_user_id", Integer, ForeignKey("users.id")),
+    Column("status", String),
+)
+
+Table(
+    "contacts", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String, index=True),
+    Column("email", String, nullable=True),
+    Column("phone", String, nullable=True),
+    Column("notes", String, nullable=True),
+    Column("user_id", Integer, ForeignKey("users.id")),
+)
+
+Table(
+    "contact_shares", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("contact_id", Integer, ForeignKey("contacts.id")),
+    Column("shared_with_user_id", Integer, ForeignKey("users.id")),
+    Column("permission", String),
+)
+
+Table(
+    "events", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String, index=True),
+    Column("date", String, nullable=True),
+    Column("description", String, nullable=True),
+    Column("user_id", Integer, ForeignKey("users.id")),
+)
+
+Table(
+    "event_shares", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("event_id", Integer, ForeignKey("events.id")),
+    Column("shared_with_user_id", Integer, ForeignKey("users.id")),
+    Column("permission", String),
+)
+
+Table(
+    "event_recipients", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("event_id", Integer, ForeignKey("events.id")),
+    Column("contact_id", Integer, ForeignKey("contacts.id")),
+    Column("budget_limit", Float),
+    Column("notes", String, nullable=True),
+)
+
+Table(
+    "gifts", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("event_recipient_id", Integer, ForeignKey("event_recipients.id")),
+    Column("name", String, index=True),
+    Column("description", String, nullable=True),
+    Column("amount", Float),
+    Column("purchased", Boolean),
+    Column("url", String, nullable=True),
+)
+
+
+def upgrade(conn):
+    metadata.create_all(conn, checkfirst=True)
@@ -0,0 +1,34 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, MetaData, String, Table, Text
+
+metadata = MetaData()
+
+Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True),
+)
+
+Table(
+    "jobs", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id"), index=True),
+    Column("kind", String),
+    Column("payload", Text, nullable=True),
+    Column("status", String),
+    Column("priority", Integer),
+    Column("attempts", Integer),
+    Column("max_attempts", Integer),
+    Column("progress", Integer),
+    Column("total", Integer, nullable=True),
+    Column("result", Text, nullable=True),
+    Column("error", Text, nullable=True),
+    Column("locked_by", String, nullable=True),
+    Column("run_at", DateTime),
+    Column("created_at", DateTime),
+    Column("started_at", DateTime, nullable=True),
+    Column("finished_at", DateTime, nullable=True),
+    Index("ix_jobs_queue", "status", "priority", "run_at"),
+)
+
+
+def upgrade(conn):
+    metadata.tables["jobs"].create(conn, checkfirst=True)
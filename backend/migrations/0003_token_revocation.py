@@ -0,0 +1,16 @@
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table
+from migrations import add_column
+
+metadata = MetaData()
+
+Table(
+    "revoked_tokens", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("jti", String, unique=True, index=True),
+    Column("expires_at", DateTime, index=True),
+)
+
+
+def upgrade(conn):
+    add_column(conn, "users", Column("token_version", Integer, server_default="0"))
+    metadata.tables["revoked_tokens"].create(conn, checkfirst=True)
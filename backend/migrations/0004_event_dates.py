@@ -0,0 +1,46 @@
+from datetime import datetime
+from sqlalchemy import text
+from migrations import has_index
+
+# events.date was free text. Normalize it to ISO dates, then make it a real DATE column.
+# Values that can't be parsed are cleared and kept in the description instead.
+
+DATE_FORMATS = [
+    "%Y-%m-%d", "%Y/%m/%d", "%m/%d/%Y", "%m/%d/%y", "%d.%m.%Y",
+    "%B %d, %Y", "%b %d, %Y", "%B %d %Y", "%b %d %Y", "%d %B %Y", "%d %b %Y",
+]
+
+
+def parse_date(value):
+    value = value.strip()
+    if not value:
+        return None
+    # Also accepts full timestamps such as 2024-12-25T00:00:00
+    candidates = [value, value[:10]]
+    for candidate in candidates:
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.strptime(candidate, fmt).date()
+            except ValueError:
+                continue
+    return None
+
+
+def upgrade(conn):
+    rows = conn.execute(text("SELECT id, date, description FROM events WHERE date IS NOT NULL")).fetchall()
+    for row in rows:
+        raw = str(row.date)
+        parsed = parse_date(raw)
+        params = {"id": row.id, "date": parsed.isoformat() if parsed else None}
+        if parsed is None and raw.strip():
+            params["description"] = f"{row.description}\n(Original date: {raw})" if row.description else f"(Original date: {raw})"
+            conn.execute(text("UPDATE events SET date = :date, description = :description WHERE id = :id"), params)
+        elif raw != params["date"]:
+            conn.execute(text("UPDATE events SET date = :date WHERE id = :id"), params)
+
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("ALTER TABLE events ALTER COLUMN date TYPE DATE USING date::date"))
+    # SQLite keeps the declared column type, but stores ISO strings, which is what the Date type reads
+
+    if not has_index(conn, "events", "ix_events_user_date"):
+        conn.execute(text("CREATE INDEX ix_events_user_date ON events (user_id, date)"))
@@ -0,0 +1,100 @@
+from sqlalchemy import Boolean, Column, Date, Float, ForeignKey, Integer, MetaData, Table, case, delete, extract, func, insert, select, text
+from migrations import has_index
+
+metadata = MetaData()
+
+Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True),
+)
+
+events = Table(
+    "events", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer),
+    Column("date", Date),
+)
+
+recipients = Table(
+    "event_recipients", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("event_id", Integer),
+    Column("contact_id", Integer),
+    Column("budget_limit", Float),
+)
+
+gifts = Table(
+    "gifts", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("event_recipient_id", Integer),
+    Column("amount", Float),
+    Column("purchased", Boolean),
+)
+
+rollups = Table(
+    "gift_rollups", metadata,
+    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column("contact_id", Integer, primary_key=True),
+    Column("year", Integer, primary_key=True),
+    Column("recipients", Integer, nullable=False),
+    Column("gifts", Integer, nullable=False),
+    Column("spent", Float, nullable=False),
+    Column("purchased_gifts", Integer, nullable=False),
+    Column("purchased_spent", Float, nullable=False),
+    Column("budgeted_recipients", Integer, nullable=False),
+    Column("budget", Float, nullable=False),
+    Column("budgeted_spent", Float, nullable=False),
+    Column("over_budget", Integer, nullable=False),
+)
+
+
+def upgrade(conn):
+    # Incremental rollup updates look up one recipient's gifts, or one event's recipients
+    if not has_index(conn, "gifts", "ix_gifts_event_recipient_id"):
+        conn.execute(text("CREATE INDEX ix_gifts_event_recipient_id ON gifts (event_recipient_id)"))
+    if not has_index(conn, "event_recipients", "ix_event_recipients_event_id"):
+        conn.execute(text("CREATE INDEX ix_event_recipients_event_id ON event_recipients (event_id)"))
+
+    rollups.create(conn, checkfirst=True)
+    backfill(conn)
+
+
+def backfill(conn):
+    # Same totals as analytics.rebuild, computed in SQL: one row per recipient, then summed
+    # per (user, contact, year). Year 0 holds undated events.
+    purchased = gifts.c.purchased.is_(True)
+    per_recipient = select(
+        events.c.user_id,
+        recipients.c.contact_id,
+        func.coalesce(extract("year", events.c.date), 0).label("year"),
+        func.coalesce(recipients.c.budget_limit, 0).label("budget"),
+        func.count(gifts.c.id).label("gifts"),
+        func.coalesce(func.sum(gifts.c.amount), 0).label("spent"),
+        func.coalesce(func.sum(case((purchased, 1), else_=0)), 0).label("purchased_gifts"),
+        func.coalesce(func.sum(case((purchased, gifts.c.amount), else_=0)), 0).label("purchased_spent"),
+    ).select_from(
+        recipients.join(events, events.c.id == recipients.c.event_id).outerjoin(gifts, gifts.c.event_recipient_id == recipients.c.id)
+    ).group_by(
+        recipients.c.id, recipients.c.contact_id, recipients.c.budget_limit, events.c.user_id, events.c.date
+    ).subquery()
+
+    r = per_recipient.c
+    budgeted = r.budget > 0
+    totals = select(
+        r.user_id, r.contact_id, r.year,
+        func.count().label("recipients"),
+        func.sum(r.gifts),
+        func.sum(r.spent),
+        func.sum(r.purchased_gifts),
+        func.sum(r.purchased_spent),
+        func.sum(case((budgeted, 1), else_=0)),
+        func.sum(r.budget),
+        func.sum(case((budgeted, r.spent), else_=0)),
+        func.sum(case((budgeted & (r.spent > r.budget), 1), else_=0)),
+    ).group_by(r.user_id, r.contact_id, r.year)
+
+    conn.execute(delete(rollups))
+    conn.execute(insert(rollups).from_select([
+        "user_id", "contact_id", "year", "recipients", "gifts", "spent", "purchased_gifts", "purchased_spent",
+        "budgeted_recipients", "budget", "budgeted_spent", "over_budget",
+    ], totals))
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Date, DateTime, ForeignKey, Integer, LargeBinary, MetaData, String, Table
+
+metadata = MetaData()
+
+Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True),
+)
+
+Table(
+    "archived_events", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id"), index=True),
+    Column("name", String),
+    Column("date", Date, nullable=True),
+    Column("archived_at", DateTime),
+    Column("payload", LargeBinary),
+)
+
+
+def upgrade(conn):
+    # Only creates the table; moving old events is done in batches by `python archive.py run`
+    metadata.tables["archived_events"].create(conn, checkfirst=True)
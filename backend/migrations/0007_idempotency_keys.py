@@ -0,0 +1,17 @@
+from sqlalchemy import Column, DateTime, Integer, LargeBinary, MetaData, String, Table, Text
+
+metadata = MetaData()
+
+Table(
+    "idempotency_keys", metadata,
+    Column("key", String, primary_key=True),
+    Column("fingerprint", String),
+    Column("status_code", Integer, nullable=True),
+    Column("headers", Text, nullable=True),
+    Column("body", LargeBinary, nullable=True),
+    Column("created_at", DateTime, index=True),
+)
+
+
+def upgrade(conn):
+    metadata.tables["idempotency_keys"].create(conn, checkfirst=True)
@@ -0,0 +1,9 @@
+from sqlalchemy import Column, DateTime, text
+from migrations import add_column, has_index
+
+
+def upgrade(conn):
+    # Workers sync revocations by time; ids can commit out of order on PostgreSQL
+    add_column(conn, "revoked_tokens", Column("revoked_at", DateTime))
+    if not has_index(conn, "revoked_tokens", "ix_revoked_tokens_revoked_at"):
+        conn.execute(text("CREATE INDEX ix_revoked_tokens_revoked_at ON revoked_tokens (revoked_at)"))
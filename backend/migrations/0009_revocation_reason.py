@@ -0,0 +1,7 @@
+from sqlalchemy import Column, String
+from migrations import add_column
+
+
+def upgrade(conn):
+    # "rotated" marks refresh tokens replaced by /token/refresh, which get a reuse grace window
+    add_column(conn, "revoked_tokens", Column("reason", String))
@@ -0,0 +1,80 @@
+import json
+import zlib
+from sqlalchemy import inspect, text
+
+# SQLite reuses the highest rowid once that row is deleted, so archiving the newest event let the
+# next new event take its id, shadowing the archived copy. AUTOINCREMENT keeps ids monotonic.
+# SQLite can't add it to an existing table: each table is rebuilt (create, copy, drop, rename).
+# PostgreSQL sequences never hand out an id twice, so there is nothing to do there.
+
+TABLES = {
+    "events": """
+        CREATE TABLE events__new (
+            id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+            name VARCHAR,
+            date VARCHAR,
+            description VARCHAR,
+            user_id INTEGER REFERENCES users (id)
+        )""",
+    "event_recipients": """
+        CREATE TABLE event_recipients__new (
+            id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+            event_id INTEGER REFERENCES events (id),
+            contact_id INTEGER REFERENCES contacts (id),
+            budget_limit FLOAT,
+            notes VARCHAR
+        )""",
+    "gifts": """
+        CREATE TABLE gifts__new (
+            id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+            event_recipient_id INTEGER REFERENCES event_recipients (id),
+            name VARCHAR,
+            description VARCHAR,
+            amount FLOAT,
+            purchased BOOLEAN,
+            url VARCHAR
+        )""",
+}
+
+
+def _rebuild(conn, table: str, create: str):
+    current = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table}).scalar()
+    if "AUTOINCREMENT" in (current or "").upper():
+        return
+    inspector = inspect(conn)
+    indexes = inspector.get_indexes(table)
+    columns = ", ".join(column["name"] for column in inspector.get_columns(table))
+    conn.execute(text(create))
+    conn.execute(text(f"INSERT INTO {table}__new ({columns}) SELECT {columns} FROM {table}"))
+    conn.execute(text(f"DROP TABLE {table}"))
+    conn.execute(text(f"ALTER TABLE {table}__new RENAME TO {table}"))
+    for index in indexes:
+        unique = "UNIQUE " if index["unique"] else ""
+        conn.execute(text(f"CREATE {unique}INDEX {index['name']} ON {table} ({', '.join(index['column_names'])})"))
+
+
+def _reserve(conn, table: str, highest: int):
+    # New ids start above every archived one, so restores keep their original ids
+    if not highest:
+        return
+    updated = conn.execute(text("UPDATE sqlite_sequence SET seq = MAX(seq, :seq) WHERE name = :name"), {"seq": highest, "name": table})
+    if updated.rowcount == 0:
+        conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"), {"name": table, "seq": highest})
+
+
+def upgrade(conn):
+    if conn.dialect.name != "sqlite":
+        return
+    for table, create in TABLES.items():
+        _rebuild(conn, table, create)
+
+    highest = {"events": 0, "event_recipients": 0, "gifts": 0}
+    for event_id, payload in conn.execute(text("SELECT id, payload FROM archived_events")):
+        document = json.loads(zlib.decompress(payload))
+        highest["events"] = max(highest["events"], event_id)
+        for recipient in document["recipients"]:
+            highest["event_recipients"] = max(highest["event_recipients"], recipient["id"])
+            for gift in recipient["gifts"]:
+                highest["gifts"] = max(highest["gifts"], gift["id"])
+    for table, value in highest.items():
+        _reserve(conn, table, value)
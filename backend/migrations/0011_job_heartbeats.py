@@ -0,0 +1,7 @@
+from sqlalchemy import Column, DateTime
+from migrations import add_column
+
+
+def upgrade(conn):
+    # Refreshed while a job runs, so only jobs whose worker stopped reporting count as stale
+    add_column(conn, "jobs", Column("heartbeat_at", DateTime))
@@ -0,0 +1,46 @@
+from sqlalchemy import Column, Float, ForeignKey, Integer, MetaData, Table, delete, func, insert, select
+
+metadata = MetaData()
+
+Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True),
+)
+
+METRICS = (
+    "recipients", "gifts", "spent", "purchased_gifts", "purchased_spent",
+    "budgeted_recipients", "budget", "budgeted_spent", "over_budget",
+)
+
+rollups = Table(
+    "gift_rollups", metadata,
+    Column("user_id", Integer, primary_key=True),
+    Column("contact_id", Integer, primary_key=True),
+    Column("year", Integer, primary_key=True),
+    *(Column(metric, Float) for metric in METRICS),
+)
+
+year_rollups = Table(
+    "gift_year_rollups", metadata,
+    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column("year", Integer, primary_key=True),
+    Column("recipients", Integer, nullable=False),
+    Column("gifts", Integer, nullable=False),
+    Column("spent", Float, nullable=False),
+    Column("purchased_gifts", Integer, nullable=False),
+    Column("purchased_spent", Float, nullable=False),
+    Column("budgeted_recipients", Integer, nullable=False),
+    Column("budget", Float, nullable=False),
+    Column("budgeted_spent", Float, nullable=False),
+    Column("over_budget", Integer, nullable=False),
+)
+
+
+def upgrade(conn):
+    # Year totals were summed from gift_rollups on every request; store them once per (user, year)
+    year_rollups.create(conn, checkfirst=True)
+    totals = select(
+        rollups.c.user_id, rollups.c.year, *(func.sum(rollups.c[metric]) for metric in METRICS)
+    ).group_by(rollups.c.user_id, rollups.c.year)
+    conn.execute(delete(year_rollups))
+    conn.execute(insert(year_rollups).from_select(["user_id", "year", *METRICS], totals))
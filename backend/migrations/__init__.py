@@ -0,0 +1,99 @@
+import importlib
+import os
+import re
+from datetime import datetime
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+# Minimal versioned migrations: each module in this package named NNNN_description.py
+# defines upgrade(conn). Applied versions are recorded in schema_migrations.
+
+MIGRATIONS_DIR = os.path.dirname(__file__)
+_REVISION_FILE = re.compile(r"^(\d{4})_(\w+)\.py$")
+# Arbitrary key for pg_advisory_lock so concurrent deploys don't migrate at the same time
+_ADVISORY_LOCK_KEY = 7340221
+
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", String, primary_key=True),
+    Column("name", String),
+    Column("applied_at", DateTime),
+)
+
+
+def revisions():
+    found = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = _REVISION_FILE.match(filename)
+        if match:
+            found.append((match.group(1), match.group(2)))
+    return found
+
+
+def applied_versions(conn: Connection):
+    schema_migrations.create(conn, checkfirst=True)
+    return {row.version for row in conn.execute(schema_migrations.select())}
+
+
+def pending(engine: Engine):
+    with engine.connect() as conn:
+        done = applied_versions(conn)
+        conn.commit()
+    return [(version, name) for version, name in revisions() if version not in done]
+
+
+def upgrade(engine: Engine, target: str = None, log=print):
+    applied = []
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _ADVISORY_LOCK_KEY})
+            conn.commit()
+        try:
+            done = applied_versions(conn)
+            conn.commit()
+            for version, name in revisions():
+                if target and version > target:
+                    break
+                if version in done:
+                    continue
+                module = importlib.import_module(f"migrations.{version}_{name}")
+                log(f"Applying {version}_{name}")
+                # Each revision commits on its own so a failure leaves earlier ones recorded
+                with conn.begin():
+                    module.upgrade(conn)
+                    conn.execute(schema_migrations.insert().values(
+                        version=version, name=name, applied_at=datetime.utcnow()
+                    ))
+                applied.append(version)
+        finally:
+            if conn.dialect.name == "postgresql":
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _ADVISORY_LOCK_KEY})
+                conn.commit()
+    return applied
+
+
+# Helpers for revisions
+
+def has_table(conn: Connection, table: str) -> bool:
+    return inspect(conn).has_table(table)
+
+
+def has_column(conn: Connection, table: str, column: str) -> bool:
+    return any(c["name"] == column for c in inspect(conn).get_columns(table))
+
+
+def has_index(conn: Connection, table: str, index: str) -> bool:
+    return any(i["name"] == index for i in inspect(conn).get_indexes(table))
+
+
+def add_column(conn: Connection, table: str, column: Column):
+    # Databases created before migrations existed may already have the column
+    if has_column(conn, table, column.name):
+        return
+    column_type = column.type.compile(dialect=conn.dialect)
+    ddl = f"ALTER TABLE {table} ADD COLUMN {column.name} {column_type}"
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+    conn.execute(text(ddl))
@@ -1,6 +1,7 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, Date, Enum
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, Date, DateTime, Enum, Text, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from database import Base
+from datetime import datetime
 import enum
 
 class FriendRequestStatus(str, enum.Enum):
@@ -13,6 +14,12 @@ class PermissionLevel(str, enum.Enum):
     WRITE = "write"
     ADMIN = "admin"  # Can delete and manage sharing
 
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
 class User(Base):
     __tablename__ = "users"
 
@@ -21,6 +28,7 @@ class User(Base):
     email = Column(String, unique=True, index=True)
     hashed_password = Column(String)
     full_name = Column(String)
+    token_version = Column(Integer, default=0)  # Bumped to invalidate every issued token
     
     contacts = relationship("Contact", back_populates="owner", cascade="all, delete-orphan")
     events = relationship("Event", back_populates="owner", cascade="all, delete-orphan")
@@ -67,7 +75,7 @@ class Event(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
-    date = Column(String, nullable=True)
+    date = Column(Date, nullable=True)
     description = Column(String, nullable=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     
@@ -75,6 +83,12 @@ class Event(Base):
     recipients = relationship("EventRecipient", back_populates="event", cascade="all, delete-orphan")
     shares = relationship("EventShare", back_populates="event", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_events_user_date", "user_id", "date"),
+        # Ids are never reused, so an archived event's id can't be handed to a new one
+        {"sqlite_autoincrement": True},
+    )
+
 class EventShare(Base):
     __tablename__ = "event_shares"
 
@@ -90,7 +104,7 @@ class EventRecipient(Base):
     __tablename__ = "event_recipients"
 
     id = Column(Integer, primary_key=True, index=True)
-    event_id = Column(Integer, ForeignKey("events.id"))
+    event_id = Column(Integer, ForeignKey("events.id"), index=True)
     contact_id = Column(Integer, ForeignKey("contacts.id"))
     budget_limit = Column(Float, default=0.0)
     notes = Column(String, nullable=True)
@@ -99,11 +113,13 @@ class EventRecipient(Base):
     contact = relationship("Contact")
     gifts = relationship("Gift", back_populates="recipient", cascade="all, delete-orphan")
 
+    __table_args__ = {"sqlite_autoincrement": True}
+
 class Gift(Base):
     __tablename__ = "gifts"
 
     id = Column(Integer, primary_key=True, index=True)
-    event_recipient_id = Column(Integer, ForeignKey("event_recipients.id"))
+    event_recipient_id = Column(Integer, ForeignKey("event_recipients.id"), index=True)
     name = Column(String, index=True)
     description = Column(String, nullable=True)
     amount = Column(Float, default=0.0)
@@ -111,3 +127,95 @@ class Gift(Base):
     url = Column(String, nullable=True)
     
     recipient = relationship("EventRecipient", back_populates="gifts")
+
+    __table_args__ = {"sqlite_autoincrement": True}
+
+class ArchivedEvent(Base):
+    # A past event moved out of the live tables; payload is zlib-compressed JSON (see archive.py)
+    __tablename__ = "archived_events"
+
+    id = Column(Integer, primary_key=True)  # The id the event had while live
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    name = Column(String)
+    date = Column(Date, nullable=True)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+    payload = Column(LargeBinary)
+
+class IdempotencyKey(Base):
+    # Stored responses for Idempotency-Key replays when IDEMPOTENCY_STORE=database (see idempotency.py)
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)  # user id, method, path and client key
+    fingerprint = Column(String)
+    status_code = Column(Integer, nullable=True)  # NULL while the first request is still running
+    headers = Column(Text, nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class GiftRollup(Base):
+    # Per-person, per-year totals maintained by analytics.py; year 0 holds undated events
+    __tablename__ = "gift_rollups"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    contact_id = Column(Integer, primary_key=True)
+    year = Column(Integer, primary_key=True)
+    recipients = Column(Integer, default=0, nullable=False)
+    gifts = Column(Integer, default=0, nullable=False)
+    spent = Column(Float, default=0.0, nullable=False)
+    purchased_gifts = Column(Integer, default=0, nullable=False)
+    purchased_spent = Column(Float, default=0.0, nullable=False)
+    budgeted_recipients = Column(Integer, default=0, nullable=False)
+    budget = Column(Float, default=0.0, nullable=False)
+    budgeted_spent = Column(Float, default=0.0, nullable=False)
+    over_budget = Column(Integer, default=0, nullable=False)
+
+class GiftYearRollup(Base):
+    # Per-year totals across all contacts, kept alongside gift_rollups by analytics.py
+    __tablename__ = "gift_year_rollups"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    recipients = Column(Integer, default=0, nullable=False)
+    gifts = Column(Integer, default=0, nullable=False)
+    spent = Column(Float, default=0.0, nullable=False)
+    purchased_gifts = Column(Integer, default=0, nullable=False)
+    purchased_spent = Column(Float, default=0.0, nullable=False)
+    budgeted_recipients = Column(Integer, default=0, nullable=False)
+    budget = Column(Float, default=0.0, nullable=False)
+    budgeted_spent = Column(Float, default=0.0, nullable=False)
+    over_budget = Column(Integer, default=0, nullable=False)
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    kind = Column(String)
+    payload = Column(Text, nullable=True)  # JSON
+    status = Column(String, default=JobStatus.QUEUED.value)
+    priority = Column(Integer, default=0)  # Higher runs first
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    progress = Column(Integer, default=0)
+    total = Column(Integer, nullable=True)
+    result = Column(Text, nullable=True)  # JSON
+    error = Column(Text, nullable=True)
+    locked_by = Column(String, nullable=True)
+    run_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # Refreshed by the worker process while running
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_jobs_queue", "status", "priority", "run_at"),
+    )
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    jti = Column(String, unique=True, index=True)
+    expires_at = Column(DateTime, index=True)
+    revoked_at = Column(DateTime, default=datetime.utcnow, index=True)
+    reason = Column(String, nullable=True)  # "rotated" for refresh tokens replaced by /token/refresh
@@ -0,0 +1,142 @@
+from typing import Callable, Iterable, List, Optional
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import Session
+import models
+import analytics
+
+# Heavy operations shared by the request handlers and the background job worker
+
+BATCH_SIZE = 500
+
+Progress = Optional[Callable[[int, Optional[int]], None]]
+
+
+def _chunks(items: List, size: int = BATCH_SIZE) -> Iterable[List]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def share_contacts(db: Session, owner_id: int, contact_ids: List[int], shared_with_user_id: int, permission: str, progress: Progress = None) -> int:
+    contact_ids = list(dict.fromkeys(contact_ids))
+    shared_count = 0
+    done = 0
+    for chunk in _chunks(contact_ids):
+        owned = {
+            contact_id for (contact_id,) in db.query(models.Contact.id).filter(
+                models.Contact.id.in_(chunk),
+                models.Contact.user_id == owner_id
+            )
+        }
+        existing = {
+            share.contact_id: share for share in db.query(models.ContactShare).filter(
+                models.ContactShare.contact_id.in_(owned),
+                models.ContactShare.shared_with_user_id == shared_with_user_id
+            )
+        } if owned else {}
+
+        for contact_id in chunk:
+            if contact_id not in owned:
+                continue
+            if contact_id in existing:
+                existing[contact_id].permission = permission
+            else:
+                db.add(models.ContactShare(
+                    contact_id=contact_id,
+                    shared_with_user_id=shared_with_user_id,
+                    permission=permission
+                ))
+            shared_count += 1
+
+        done += len(chunk)
+        if progress:
+            progress(done, len(contact_ids))
+        db.commit()
+    return shared_count
+
+
+def clone_event(db: Session, event_id: int, owner_id: int, name: Optional[str] = None, include_gifts: bool = True, progress: Progress = None) -> Optional[models.Event]:
+    event = db.query(models.Event).filter(models.Event.id == event_id, models.Event.user_id == owner_id).first()
+    if not event:
+        return None
+
+    new_event = models.Event(
+        name=name or f"{event.name} (copy)",
+        date=event.date,
+        description=event.description,
+        user_id=owner_id
+    )
+    db.add(new_event)
+    db.flush()
+
+    recipients = db.query(models.EventRecipient).filter(models.EventRecipient.event_id == event_id).all()
+    for done, recipient in enumerate(recipients, start=1):
+        new_recipient = models.EventRecipient(
+            event_id=new_event.id,
+            contact_id=recipient.contact_id,
+            budget_limit=recipient.budget_limit,
+            notes=recipient.notes
+        )
+        db.add(new_recipient)
+        db.flush()
+        if include_gifts and recipient.gifts:
+            # Cloned gifts start out unpurchased
+            db.execute(insert(models.Gift), [
+                {
+                    "event_recipient_id": new_recipient.id,
+                    "name": gift.name,
+                    "description": gift.description,
+                    "amount": gift.amount,
+                    "purchased": False,
+                    "url": gift.url,
+                }
+                for gift in recipient.gifts
+            ])
+        if progress:
+            progress(done, len(recipients))
+
+    analytics.record_change(db, {}, analytics.snapshot(db, event_id=new_event.id))
+    # Clone in one transaction so a failure never leaves a half-copied event
+    db.commit()
+    db.refresh(new_event)
+    return new_event
+
+
+def owns_event(db: Session, event_id: int, owner_id: int) -> bool:
+    # Live or archived
+    return bool(
+        db.query(models.Event.id).filter(models.Event.id == event_id, models.Event.user_id == owner_id).first()
+        or db.query(models.ArchivedEvent.id).filter(models.ArchivedEvent.id == event_id, models.ArchivedEvent.user_id == owner_id).first()
+    )
+
+
+def delete_event(db: Session, event_id: int, owner_id: int, progress: Progress = None) -> bool:
+    event = db.query(models.Event.id).filter(models.Event.id == event_id, models.Event.user_id == owner_id).first()
+    if not event:
+        archived = db.query(models.ArchivedEvent).filter(
+            models.ArchivedEvent.id == event_id,
+            models.ArchivedEvent.user_id == owner_id
+        ).first()
+        if not archived:
+            return False
+        analytics.record_change(db, analytics.archived_snapshot(archived), {})
+        db.delete(archived)
+        db.commit()
+        return True
+
+    analytics.record_change(db, analytics.snapshot(db, event_id=event_id), {})
+
+    # Bulk statements instead of ORM cascades, which load every child row first
+    recipient_ids = [
+        recipient_id for (recipient_id,) in db.query(models.EventRecipient.id).filter(models.EventRecipient.event_id == event_id)
+    ]
+    done = 0
+    for chunk in _chunks(recipient_ids):
+        db.execute(delete(models.Gift).where(models.Gift.event_recipient_id.in_(chunk)).execution_options(synchronize_session=False))
+        done += len(chunk)
+        if progress:
+            progress(done, len(recipient_ids))
+    db.execute(delete(models.EventRecipient).where(models.EventRecipient.event_id == event_id).execution_options(synchronize_session=False))
+    db.execute(delete(models.EventShare).where(models.EventShare.event_id == event_id).execution_options(synchronize_session=False))
+    db.execute(delete(models.Event).where(models.Event.id == event_id).execution_options(synchronize_session=False))
+    db.commit()
+    return True
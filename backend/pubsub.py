@@ -0,0 +1,137 @@
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Optional, Set, Tuple
+from pydantic import BaseModel
+from sqlalchemy import text
+
+# Fan-out of event changes to /events/{id}/stream subscribers.
+# The default backend delivers in-process; PUBSUB_BACKEND=postgres relays through
+# LISTEN/NOTIFY so a change made on one worker reaches subscribers on every worker.
+
+logger = logging.getLogger("pubsub")
+
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "memory")
+NOTIFY_CHANNEL = "gift_planner_events"
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+NOTIFY_MAX_BYTES = 7999
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[int, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = defaultdict(set)
+
+    def subscribe(self, event_id: int) -> Tuple[asyncio.AbstractEventLoop, asyncio.Queue]:
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE))
+        with self._lock:
+            self._subscribers[event_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, event_id: int, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(event_id)
+            if subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[event_id]
+
+    def dispatch(self, event_id: int, message: dict):
+        # Called from request threadpool threads, so hand off to each subscriber's loop
+        with self._lock:
+            subscribers = list(self._subscribers.get(event_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, message)
+            except RuntimeError:
+                # Loop already closed; the stream's finally block will unsubscribe
+                pass
+
+
+def _offer(queue: asyncio.Queue, message: dict):
+    if queue.full():
+        # A stalled client loses its oldest message rather than blocking publishers
+        queue.get_nowait()
+    queue.put_nowait(message)
+
+
+broker = Broker()
+_engine = None
+_listener: Optional[threading.Thread] = None
+_stopping = threading.Event()
+
+
+def _to_data(data: Any):
+    if isinstance(data, BaseModel):
+        return data.model_dump(mode="json")
+    return data
+
+
+def publish(event_id: int, type: str, data: Any = None):
+    message = {"type": type, "event_id": event_id, "data": _to_data(data)}
+    if _engine is not None:
+        payload = json.dumps(message, default=str)
+        if len(payload.encode()) > NOTIFY_MAX_BYTES:
+            # Long descriptions, notes or URLs: tell subscribers to reload the event instead
+            payload = json.dumps({"type": "resync", "event_id": event_id, "data": None})
+        try:
+            with _engine.begin() as conn:
+                conn.execute(text("SELECT pg_notify(:channel, :payload)"), {
+                    "channel": NOTIFY_CHANNEL,
+                    "payload": payload
+                })
+            return
+        except Exception:
+            logger.exception("pg_notify failed; delivering locally only")
+    broker.dispatch(event_id, message)
+
+
+def _listen(engine):
+    while not _stopping.is_set():
+        try:
+            conn = engine.raw_connection()
+            try:
+                dbapi_conn = conn.dbapi_connection
+                dbapi_conn.autocommit = True
+                cursor = dbapi_conn.cursor()
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                while not _stopping.is_set():
+                    if select.select([dbapi_conn], [], [], 5) == ([], [], []):
+                        continue
+                    dbapi_conn.poll()
+                    while dbapi_conn.notifies:
+                        notify = dbapi_conn.notifies.pop(0)
+                        message = json.loads(notify.payload)
+                        broker.dispatch(message["event_id"], message)
+            finally:
+                conn.invalidate()
+        except Exception:
+            logger.exception("LISTEN connection lost; reconnecting")
+            _stopping.wait(2)
+
+
+def start(engine):
+    global _engine, _listener
+    if PUBSUB_BACKEND != "postgres" or _listener is not None:
+        return
+    if engine.dialect.name != "postgresql":
+        logger.warning("PUBSUB_BACKEND=postgres needs a PostgreSQL database; using in-process delivery")
+        return
+    _stopping.clear()
+    _engine = engine
+    _listener = threading.Thread(target=_listen, args=(engine,), name="pubsub-listener", daemon=True)
+    _listener.start()
+
+
+def stop():
+    global _engine, _listener
+    _stopping.set()
+    if _listener is not None:
+        _listener.join(6)
+    _engine = None
+    _listener = None
@@ -0,0 +1,270 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Tuple
+import auth
+import sharedcache
+
+# Token-bucket rate limiting per user and per client IP, plus a concurrency cap that
+# sheds load before the database pool saturates. Buckets live in process memory by
+# default. RATE_LIMIT_STORE=shared keeps them in memory shared by the workers of one
+# serve.py server; set RATE_LIMIT_REDIS_URL to share them across servers.
+
+logger = logging.getLogger("ratelimit")
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")
+RATE_LIMIT_SHARED_SLOTS = int(os.getenv("RATE_LIMIT_SHARED_SLOTS", "65536"))
+TRUST_PROXY_HEADERS = os.getenv("TRUST_PROXY_HEADERS", "false").lower() == "true"
+# Proxies in front of the app that append to X-Forwarded-For (Railway/Render/Heroku: 1).
+# Entries left of those are whatever the client sent, so they are never used.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+# Default is about twice the SQLAlchemy pool (5 + 10 overflow): past that, requests only queue for connections
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "32"))
+ADMISSION_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_TIMEOUT_SECONDS", "0.5"))
+# Several people can share one address (NAT, offices), so IP buckets get a larger budget
+IP_LIMIT_MULTIPLIER = int(os.getenv("RATE_LIMIT_IP_MULTIPLIER", "5"))
+
+def _parse_limit(value: str) -> Tuple[int, float]:
+    # "requests/seconds", e.g. "10/60" is a burst of 10 refilling over a minute
+    requests, seconds = value.split("/")
+    return int(requests), float(seconds)
+
+LIMITS = {
+    "auth": _parse_limit(os.getenv("RATE_LIMIT_AUTH", "10/60")),
+    "refresh": _parse_limit(os.getenv("RATE_LIMIT_REFRESH", "20/60")),
+    "search": _parse_limit(os.getenv("RATE_LIMIT_SEARCH", "30/60")),
+    "write": _parse_limit(os.getenv("RATE_LIMIT_WRITE", "120/60")),
+    "read": _parse_limit(os.getenv("RATE_LIMIT_READ", "600/60")),
+}
+
+AUTH_PATHS = {"/token", "/register"}
+REFRESH_PATH = "/token/refresh"
+# Refresh bodies are a single token; anything larger isn't parsed for a user id
+MAX_REFRESH_BODY_BYTES = 16 * 1024
+EXEMPT_PATHS = {"/", "/health"}
+
+
+def route_class(method: str, path: str) -> str:
+    if path in AUTH_PATHS:
+        return "auth"
+    if path == REFRESH_PATH:
+        return "refresh"
+    if path == "/users/search":
+        return "search"
+    if method in ("POST", "PUT", "PATCH", "DELETE"):
+        return "write"
+    return "read"
+
+
+class MemoryBackend:
+    MAX_KEYS = 100_000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def take(self, key: str, capacity: int, period: float) -> float:
+        # Returns 0 when allowed, otherwise seconds until a token is available
+        rate = capacity / period
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.MAX_KEYS:
+                self._evict(now)
+            return (1 - tokens) / rate
+
+    def _evict(self, now: float):
+        # Drop the oldest half; an evicted bucket simply starts full again
+        by_age = sorted(self._buckets.items(), key=lambda item: item[1][1])
+        for key, _ in by_age[:len(by_age) // 2]:
+            del self._buckets[key]
+
+
+class SharedMemoryBackend:
+    # Same algorithm as MemoryBackend over sharedcache.SharedBuckets. The lock only covers this
+    # process, so workers racing on one bucket can each spend the same token.
+    def __init__(self, buckets: sharedcache.SharedBuckets):
+        self._buckets = buckets
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: int, period: float) -> float:
+        slot = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little", signed=True)
+        rate = capacity / period
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._buckets.get(slot) or (capacity, now)
+            tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+            if tokens >= 1:
+                self._buckets.set(slot, tokens - 1, now)
+                return 0
+            self._buckets.set(slot, tokens, now)
+            return (1 - tokens) / rate
+
+
+# Created at import so the serve.py master owns it and forked workers share it
+_shared_buckets = sharedcache.SharedBuckets(RATE_LIMIT_SHARED_SLOTS) if RATE_LIMIT_STORE == "shared" else None
+
+
+class RedisBackend:
+    # Same algorithm as MemoryBackend, run atomically inside Redis
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + (now - updated) * rate)
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url: str):
+        import redis  # Optional dependency, only needed for shared buckets
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def take(self, key: str, capacity: int, period: float) -> float:
+        try:
+            return float(self._script(keys=[f"ratelimit:{key}"], args=[capacity, capacity / period, time.time()]))
+        except Exception:
+            # Fail open: an unreachable limiter store shouldn't take the API down with it
+            logger.exception("Rate limit store unavailable")
+            return 0
+
+
+def create_backend():
+    url = os.getenv("RATE_LIMIT_REDIS_URL")
+    if url:
+        return RedisBackend(url)
+    if _shared_buckets is not None:
+        return SharedMemoryBackend(_shared_buckets)
+    return MemoryBackend()
+
+
+def _client_ip(scope) -> str:
+    if TRUST_PROXY_HEADERS and TRUSTED_PROXY_HOPS > 0:
+        forwarded = [
+            hop.strip()
+            for name, value in scope.get("headers", []) if name == b"x-forwarded-for"
+            for hop in value.decode("latin-1").split(",") if hop.strip()
+        ]
+        # The address our outermost proxy saw, appended by that proxy itself
+        if len(forwarded) >= TRUSTED_PROXY_HOPS:
+            return forwarded[-TRUSTED_PROXY_HOPS]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+async def _refresh_user_id(receive):
+    # Reads the refresh request's body for its user id; returns the id and a receive that replays the body
+    chunks, size, more_body = [], 0, True
+    while more_body and size <= MAX_REFRESH_BODY_BYTES:
+        message = await receive()
+        if message["type"] != "http.request":
+            return None, _replay([message], receive)
+        chunks.append(message)
+        size += len(message.get("body", b""))
+        more_body = message.get("more_body", False)
+    user_id = None
+    if not more_body:
+        try:
+            token = json.loads(b"".join(m.get("body", b"") for m in chunks)).get("refresh_token")
+            payload = auth.decode_token(token, "refresh") if isinstance(token, str) else None
+            user_id = payload["uid"] if payload else None
+        except (ValueError, AttributeError):
+            pass
+    return user_id, _replay(chunks, receive)
+
+
+def _replay(messages, receive):
+    pending = list(messages)
+
+    async def replay():
+        if pending:
+            return pending.pop(0)
+        return await receive()
+    return replay
+
+
+async def _reject(send, status: int, detail: str, retry_after: float):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, int(retry_after + 0.999))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, backend=None):
+        self.app = app
+        self.backend = backend or create_backend()
+        self._slots = None
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED or path in EXEMPT_PATHS or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        limit_class = route_class(scope["method"], path)
+        capacity, period = LIMITS[limit_class]
+        if limit_class == "auth":
+            # Login attempts are anonymous, so the IP budget is the only guard against guessing
+            keys = [(f"auth:ip:{_client_ip(scope)}", capacity)]
+        elif limit_class == "refresh":
+            # Every open tab refreshes every few minutes: budget per user, not per shared IP
+            keys = [(f"refresh:ip:{_client_ip(scope)}", capacity * IP_LIMIT_MULTIPLIER)]
+            user_id, receive = await _refresh_user_id(receive)
+            if user_id is not None:
+                keys = [(f"refresh:user:{user_id}", capacity)]
+        else:
+            keys = [(f"{limit_class}:ip:{_client_ip(scope)}", capacity * IP_LIMIT_MULTIPLIER)]
+            user_id = auth.scope_user_id(scope)
+            if user_id is not None:
+                keys.append((f"{limit_class}:user:{user_id}", capacity))
+        for key, key_capacity in keys:
+            wait = self.backend.take(key, key_capacity, period)
+            if wait > 0:
+                await _reject(send, 429, "Too many requests", wait)
+                return
+
+        # Long-lived streams would hold a slot for their whole lifetime
+        if path.endswith("/stream"):
+            await self.app(scope, receive, send)
+            return
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), ADMISSION_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            await _reject(send, 503, "Server is busy, please retry", 1)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self._slots.release()
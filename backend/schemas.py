@@ -1,10 +1,24 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, field_validator
+from typing import Any, List, Optional
+from datetime import date as DateType, datetime
 from models import PermissionLevel, FriendRequestStatus
+import json
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None
+
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
+class Logout(BaseModel):
+    refresh_token: Optional[str] = None
+
+class StreamTicket(BaseModel):
+    ticket: str
+    expires_in: int
 
 class TokenData(BaseModel):
     username: Optional[str] = None
@@ -39,11 +53,30 @@ class Contact(ContactBase):
     class Config:
         from_attributes = True
 
+class ContactImportRow(BaseModel):
+    row: int
+    status: str
+    error: Optional[str] = None
+
+class ContactImportResult(BaseModel):
+    ok: bool
+    processed: int
+    imported: int
+    duplicates: int
+    errors: int
+    rows: List[ContactImportRow] = []
+
 class EventBase(BaseModel):
     name: str
-    date: Optional[str] = None
+    date: Optional[DateType] = None
     description: Optional[str] = None
 
+    @field_validator("date", mode="before")
+    @classmethod
+    def empty_date(cls, value):
+        # The date input sends "" when left blank
+        return None if value == "" else value
+
 class EventCreate(EventBase):
     pass
 
@@ -106,6 +139,7 @@ class EventRecipientDetail(EventRecipient):
 
 class EventDetail(Event):
     recipients: List[EventRecipientDetail] = []
+    archived: bool = False
 
     class Config:
         from_attributes = True
@@ -135,6 +169,9 @@ class FriendInfo(BaseModel):
     class Config:
         from_attributes = True
 
+class FriendSuggestion(FriendInfo):
+    mutual_friends: int
+
 class ContactShareCreate(BaseModel):
     contact_id: int
     shared_with_user_id: int
@@ -178,3 +215,76 @@ class EventWithShares(Event):
 
     class Config:
         from_attributes = True
+
+# Job Schemas
+
+class JobCreated(BaseModel):
+    job_id: int
+    status: str
+
+class Job(BaseModel):
+    id: int
+    kind: str
+    status: str
+    priority: int
+    attempts: int
+    max_attempts: int
+    progress: int
+    total: Optional[int] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @field_validator("result", mode="before")
+    @classmethod
+    def parse_result(cls, value):
+        return json.loads(value) if isinstance(value, str) else value
+
+    class Config:
+        from_attributes = True
+
+class ArchivedEvent(BaseModel):
+    id: int
+    name: str
+    date: Optional[DateType] = None
+    archived_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class EventArchive(BaseModel):
+    # Either explicit ids, or every dated event before `before` (default: ARCHIVE_AFTER_DAYS ago)
+    event_ids: Optional[List[int]] = None
+    before: Optional[DateType] = None
+
+class EventRestore(BaseModel):
+    event_ids: List[int]
+
+class EventClone(BaseModel):
+    name: Optional[str] = None
+    include_gifts: bool = True
+    priority: int = 0
+
+# Analytics Schemas
+
+class SpendingSummary(BaseModel):
+    recipients: int
+    gifts: int
+    spent: float
+    purchased_gifts: int
+    purchased_spent: float
+    budgeted_recipients: int
+    budget: float
+    budgeted_spent: float
+    over_budget: int
+    budget_used: Optional[float] = None
+
+class YearSpending(SpendingSummary):
+    year: Optional[int] = None
+
+class ContactYearSpending(SpendingSummary):
+    contact_id: int
+    contact_name: Optional[str] = None
+    year: Optional[int] = None
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+import gc
+import math
+import multiprocessing
+import os
+from gunicorn.app.base import BaseApplication
+
+# Production server: a gunicorn master with WEB_CONCURRENCY uvicorn workers.
+#
+#   python serve.py                      # binds $HOST:$PORT (default 0.0.0.0:8000)
+#   WEB_CONCURRENCY=4 python serve.py
+#
+# The app is imported once in the master and the workers are forked from it, so they share its
+# memory and the shared-memory auth cache (sharedcache.py) and start answering immediately.
+# Workers are recycled after MAX_REQUESTS requests (plus jitter, so they don't all restart together),
+# finishing in-flight requests first. For development keep `uvicorn main:app --reload`.
+
+
+def _read(path: str) -> str:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def _cgroup_cpus():
+    # CPU quota set by docker --cpus or Kubernetes limits, rounded up; None when unlimited
+    quota, _, period = _read("/sys/fs/cgroup/cpu.max").partition(" ")  # cgroup v2: "<quota> <period>"
+    if not quota:
+        quota, period = _read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us"), _read("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if quota in ("", "max", "-1") or not period:
+        return None
+    return max(1, math.ceil(int(quota) / int(period)))
+
+
+def cpu_count() -> int:
+    # CPUs this process may use. multiprocessing.cpu_count() reports every CPU on the host,
+    # however few of them the affinity mask or the container's quota allow.
+    count = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else multiprocessing.cpu_count()
+    quota = _cgroup_cpus()
+    return min(count, quota) if quota else count
+
+
+# Async workers each run a full event loop, so one per core is enough. Each also holds its own
+# connection pool (up to 15 connections) plus a LISTEN connection, so the default stops at
+# WEB_CONCURRENCY_MAX to stay under PostgreSQL's max_connections (100 by default) on large hosts.
+WEB_CONCURRENCY_MAX = int(os.getenv("WEB_CONCURRENCY_MAX", "4"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", str(min(cpu_count(), WEB_CONCURRENCY_MAX))))
+MAX_REQUESTS = int(os.getenv("MAX_REQUESTS", "10000"))
+MAX_REQUESTS_JITTER = int(os.getenv("MAX_REQUESTS_JITTER", "1000"))
+# Time a worker gets to finish its requests after being told to stop (recycling, deploys)
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+# A worker that stops heartbeating this long is killed and replaced
+WORKER_TIMEOUT = int(os.getenv("WORKER_TIMEOUT", "60"))
+KEEPALIVE_SECONDS = int(os.getenv("KEEPALIVE_SECONDS", "5"))
+
+
+def shared_state_defaults(database_url: str):
+    # The per-process defaults split state across workers: a retried request could run again on
+    # another worker, an event stream would miss changes made on the others, and each worker would
+    # grant the full rate limit. Explicit settings still win.
+    if WEB_CONCURRENCY <= 1:
+        return
+    os.environ.setdefault("IDEMPOTENCY_STORE", "database")
+    os.environ.setdefault("RATE_LIMIT_STORE", "shared")
+    if database_url.startswith("postgres"):
+        os.environ.setdefault("PUBSUB_BACKEND", "postgres")
+
+
+def warm():
+    # Everything done here is paid once in the master instead of once per worker
+    import database
+    # Before main imports the modules that read these
+    shared_state_defaults(database.SQLALCHEMY_DATABASE_URL)
+    import main
+    import migrations
+
+    if main.AUTO_MIGRATE:
+        # One migration run before forking, instead of every worker racing through it on startup
+        migrations.upgrade(database.get_engine())
+        main.AUTO_MIGRATE = False
+    # Connections must not cross fork(); each worker opens its own pool in the lifespan
+    database.dispose_engine()
+    # Builds and caches the OpenAPI schema, which also compiles the response models
+    main.app.openapi()
+    # Keep the preloaded objects out of the collector so workers don't dirty the shared pages
+    gc.collect()
+    gc.freeze()
+    return main.app
+
+
+class Server(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return warm()
+
+
+def options():
+    return {
+        "bind": f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}",
+        "workers": max(WEB_CONCURRENCY, 1),
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+        "max_requests": MAX_REQUESTS,
+        "max_requests_jitter": MAX_REQUESTS_JITTER,
+        "graceful_timeout": GRACEFUL_TIMEOUT,
+        "timeout": WORKER_TIMEOUT,
+        "keepalive": KEEPALIVE_SECONDS,
+        "accesslog": os.getenv("ACCESS_LOG", "-") or None,
+    }
+
+
+if __name__ == "__main__":
+    Server(options()).run()
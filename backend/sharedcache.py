@@ -0,0 +1,97 @@
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Optional, Tuple
+
+# Small caches in anonymous shared memory, so every worker of one server sees the same entries.
+# The mapping is created at import time: under serve.py the app is preloaded, so the gunicorn
+# master owns it and every forked worker (including replacements after --max-requests) shares
+# the same pages. A process that was not forked from a preloading parent just gets its own copy.
+#
+# Entries are direct-mapped by key, and a colliding key evicts the old entry. Each slot stores a
+# CRC of its contents, so a read racing a write from another process fails the check and is a miss.
+# No cross-process lock is taken on either path.
+
+_BODY = struct.Struct("<qqd")       # key, value, stored_at (wall clock, comparable across processes)
+_SLOT = struct.Struct("<qqdI4x")    # ... + crc32, padded to 32 bytes
+_BUCKET_BODY = struct.Struct("<qdd")      # key, tokens, updated (wall clock)
+_BUCKET = struct.Struct("<qddI4x")        # ... + crc32, padded to 32 bytes
+_EPOCH = struct.Struct("<q")
+_TIMESTAMP = struct.Struct("<d")
+
+
+class SharedIntTable:
+    # int key -> (int value, stored_at)
+    def __init__(self, slots: int):
+        self.slots = max(slots, 1)
+        self._map = mmap.mmap(-1, self.slots * _SLOT.size)
+
+    def _offset(self, key: int) -> int:
+        return (key % self.slots) * _SLOT.size
+
+    def get(self, key: int, max_age: float) -> Optional[int]:
+        slot_key, value, stored_at, crc = _SLOT.unpack_from(self._map, self._offset(key))
+        if slot_key != key or time.time() - stored_at >= max_age:
+            return None
+        if crc != zlib.crc32(_BODY.pack(slot_key, value, stored_at)):
+            return None
+        return value
+
+    def set(self, key: int, value: int):
+        stored_at = time.time()
+        crc = zlib.crc32(_BODY.pack(key, value, stored_at))
+        _SLOT.pack_into(self._map, self._offset(key), key, value, stored_at, crc)
+
+    def invalidate(self, key: int):
+        offset = self._offset(key)
+        self._map[offset:offset + _SLOT.size] = bytes(_SLOT.size)
+
+
+class SharedBuckets:
+    # int key -> (tokens, updated) of a token bucket. An evicted or torn bucket reads as missing,
+    # which the rate limiter treats as full.
+    def __init__(self, slots: int):
+        self.slots = max(slots, 1)
+        self._map = mmap.mmap(-1, self.slots * _BUCKET.size)
+
+    def _offset(self, key: int) -> int:
+        return (key % self.slots) * _BUCKET.size
+
+    def get(self, key: int) -> Optional[Tuple[float, float]]:
+        slot_key, tokens, updated, crc = _BUCKET.unpack_from(self._map, self._offset(key))
+        if slot_key != key or crc != zlib.crc32(_BUCKET_BODY.pack(slot_key, tokens, updated)):
+            return None
+        return tokens, updated
+
+    def set(self, key: int, tokens: float, updated: float):
+        crc = zlib.crc32(_BUCKET_BODY.pack(key, tokens, updated))
+        _BUCKET.pack_into(self._map, self._offset(key), key, tokens, updated, crc)
+
+
+class SharedTimestamps:
+    # Last time each key was touched. Keys sharing a slot share a timestamp, so a collision can
+    # only make a key look more recent than it is, never less.
+    def __init__(self, slots: int):
+        self.slots = max(slots, 1)
+        self._map = mmap.mmap(-1, self.slots * _TIMESTAMP.size)
+
+    def touch(self, key: int):
+        _TIMESTAMP.pack_into(self._map, (key % self.slots) * _TIMESTAMP.size, time.time())
+
+    def age(self, key: int) -> float:
+        return time.time() - _TIMESTAMP.unpack_from(self._map, (key % self.slots) * _TIMESTAMP.size)[0]
+
+
+class SharedEpoch:
+    # A value that changes whenever any worker calls bump(); readers compare it to the last one seen
+    def __init__(self):
+        self._map = mmap.mmap(-1, _EPOCH.size)
+
+    def read(self) -> int:
+        return _EPOCH.unpack_from(self._map)[0]
+
+    def bump(self):
+        # Random rather than +1: two workers bumping at once must still both look like a change
+        _EPOCH.pack_into(self._map, 0, int.from_bytes(os.urandom(8), "little", signed=True))
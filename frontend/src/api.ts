@@ -7,6 +7,9 @@ const api = axios.create({
   baseURL: API_BASE_URL,
 });
 
+// One key per logical create: retries (including the 401 refresh retry) replay the first response
+const idempotent = () => ({ headers: { 'Idempotency-Key': crypto.randomUUID() } });
+
 api.interceptors.request.use((config) => {
   const token = localStorage.getItem('token');
   if (token) {
@@ -15,6 +18,65 @@ api.interceptors.request.use((config) => {
   return config;
 });
 
+interface TokenResponse {
+  access_token: string;
+  refresh_token?: string;
+  token_type: string;
+  expires_in?: number;
+}
+
+const storeTokens = (tokens: TokenResponse) => {
+  localStorage.setItem('token', tokens.access_token);
+  if (tokens.refresh_token) {
+    localStorage.setItem('refresh_token', tokens.refresh_token);
+  }
+};
+
+// Access tokens are short-lived: on a 401, swap the refresh token for a new pair once and retry.
+// Tabs share one refresh token, so refreshes run under a cross-tab lock; a tab that waited for
+// it finds the pair another tab already fetched instead of presenting the rotated token again.
+let refreshing: Promise<void> | null = null;
+
+const refreshTokens = (staleAccessToken: string | null): Promise<void> => {
+  const refresh = async () => {
+    if (localStorage.getItem('token') !== staleAccessToken) {
+      return;
+    }
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (!refreshToken) {
+      throw new Error('Not logged in');
+    }
+    try {
+      const response = await axios.post<TokenResponse>(`${API_BASE_URL}/token/refresh`, { refresh_token: refreshToken });
+      storeTokens(response.data);
+    } catch (error) {
+      localStorage.removeItem('token');
+      localStorage.removeItem('refresh_token');
+      throw error;
+    }
+  };
+  refreshing = refreshing || (navigator.locks ? navigator.locks.request('token-refresh', refresh) : refresh())
+    .finally(() => {
+      refreshing = null;
+    });
+  return refreshing;
+};
+
+api.interceptors.response.use(undefined, async (error) => {
+  const original = error.config;
+  if (error.response?.status !== 401 || !localStorage.getItem('refresh_token') || original._retried || original.url === '/token/refresh') {
+    throw error;
+  }
+  original._retried = true;
+  const sentToken = (original.headers?.Authorization as string | undefined)?.replace(/^Bearer /, '') ?? null;
+  try {
+    await refreshTokens(sentToken);
+  } catch {
+    throw error;
+  }
+  return api(original);
+});
+
 export interface User {
   id: number;
   username: string;
@@ -61,6 +123,7 @@ export interface EventRecipient {
 
 export interface EventDetail extends Event {
   recipients: EventRecipient[];
+  archived?: boolean;
 }
 
 export interface FriendRequest {
@@ -79,6 +142,10 @@ export interface Friend {
   full_name?: string;
 }
 
+export interface FriendSuggestion extends Friend {
+  mutual_friends: number;
+}
+
 export interface ContactShare {
   id: number;
   contact_id: number;
@@ -105,13 +172,18 @@ export const login = async (username: string, password: string) => {
   const formData = new FormData();
   formData.append('username', username);
   formData.append('password', password);
-  const response = await api.post<{ access_token: string; token_type: string }>('/token', formData);
-  localStorage.setItem('token', response.data.access_token);
+  const response = await api.post<TokenResponse>('/token', formData);
+  storeTokens(response.data);
   return response.data;
 };
 
 export const logout = () => {
+  const refreshToken = localStorage.getItem('refresh_token');
+  if (localStorage.getItem('token')) {
+    api.post('/logout', { refresh_token: refreshToken }).catch(() => undefined);
+  }
   localStorage.removeItem('token');
+  localStorage.removeItem('refresh_token');
 };
 
 export const getCurrentUser = async () => {
@@ -126,7 +198,7 @@ export const getContacts = async () => {
 };
 
 export const createContact = async (contact: Omit<Contact, 'id' | 'user_id'>) => {
-  const response = await api.post<Contact>('/contacts', contact);
+  const response = await api.post<Contact>('/contacts', contact, idempotent());
   return response.data;
 };
 
@@ -140,8 +212,13 @@ export const deleteContact = async (id: number) => {
 };
 
 // Events
-export const getEvents = async () => {
-  const response = await api.get<Event[]>('/events');
+export const getEvents = async (params?: { from?: string; to?: string; order?: 'date' | 'id' }) => {
+  const response = await api.get<Event[]>('/events', { params });
+  return response.data;
+};
+
+export const getUpcomingEvents = async (limit = 10, days?: number) => {
+  const response = await api.get<Event[]>('/events/upcoming', { params: { limit, days } });
   return response.data;
 };
 
@@ -164,6 +241,15 @@ export const deleteEvent = async (id: number) => {
   await api.delete(`/events/${id}`);
 };
 
+export const archiveEvent = async (id: number) => {
+  await api.post(`/events/${id}/archive`);
+};
+
+export const restoreEvent = async (id: number) => {
+  const response = await api.post<Event>(`/events/${id}/restore`);
+  return response.data;
+};
+
 // Event Recipients
 export const getEventRecipients = async (eventId: number) => {
   const response = await api.get<EventRecipient[]>(`/events/${eventId}/recipients`);
@@ -174,7 +260,7 @@ export const addRecipientToEvent = async (eventId: number, contactId: number, bu
   const response = await api.post<EventRecipient>(`/events/${eventId}/recipients`, {
     contact_id: contactId,
     budget_limit: budgetLimit,
-  });
+  }, idempotent());
   return response.data;
 };
 
@@ -194,7 +280,7 @@ export const getGifts = async (recipientId: number) => {
 };
 
 export const createGift = async (recipientId: number, gift: Omit<Gift, 'id' | 'event_recipient_id'>) => {
-  const response = await api.post<Gift>(`/recipients/${recipientId}/gifts`, gift);
+  const response = await api.post<Gift>(`/recipients/${recipientId}/gifts`, gift, idempotent());
   return response.data;
 };
 
@@ -209,7 +295,7 @@ export const deleteGift = async (giftId: number) => {
 
 // Friends
 export const sendFriendRequest = async (toUsername: string) => {
-  const response = await api.post<FriendRequest>('/friends/request', { to_username: toUsername });
+  const response = await api.post<FriendRequest>('/friends/request', { to_username: toUsername }, idempotent());
   return response.data;
 };
 
@@ -231,6 +317,11 @@ export const getFriends = async () => {
   return response.data;
 };
 
+export const getFriendSuggestions = async (limit = 10) => {
+  const response = await api.get<FriendSuggestion[]>('/friends/suggestions', { params: { limit } });
+  return response.data;
+};
+
 export const searchUsers = async (query: string) => {
   const response = await api.get<Friend[]>('/users/search', { params: { q: query } });
   return response.data;
@@ -271,4 +362,52 @@ export const unshareEvent = async (eventId: number, userId: number) => {
   await api.delete(`/events/${eventId}/share/${userId}`);
 };
 
+// Live updates
+export interface EventChange {
+  type: string;
+  event_id: number;
+  data: any;
+}
+
+export const subscribeToEvent = (eventId: number, onChange: (change: EventChange) => void) => {
+  const types = [
+    'event.updated', 'event.deleted',
+    'recipient.added', 'recipient.updated', 'recipient.removed',
+    'gift.created', 'gift.updated', 'gift.deleted',
+    'share.updated', 'share.removed',
+    // Sent instead of a change too large to relay between servers: reload the event
+    'resync',
+  ];
+  let source: EventSource | null = null;
+  let closed = false;
+
+  // EventSource can't send the Authorization header, so each stream opens with a single-use
+  // ticket. The browser's own reconnect would reuse a spent ticket: reopen with a new one instead.
+  const open = async () => {
+    let ticket: string;
+    try {
+      ticket = (await api.post(`/events/${eventId}/stream/ticket`)).data.ticket;
+    } catch (error: any) {
+      // Event gone, access removed or signed out: stop. No response at all: try again later.
+      if (!error.response && !closed) setTimeout(open, 3000);
+      return;
+    }
+    if (closed) return;
+    const stream = new EventSource(`${API_BASE_URL}/events/${eventId}/stream?ticket=${encodeURIComponent(ticket)}`);
+    source = stream;
+    types.forEach((type) => {
+      stream.addEventListener(type, (e) => onChange(JSON.parse((e as MessageEvent).data)));
+    });
+    stream.onerror = () => {
+      stream.close();
+      if (!closed) setTimeout(open, 3000);
+    };
+  };
+  open();
+  return () => {
+    closed = true;
+    source?.close();
+  };
+};
+
 export default api;
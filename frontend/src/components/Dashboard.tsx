@@ -20,7 +20,7 @@ export default function Dashboard({ onLogout }: DashboardProps) {
 
   const loadEvents = async () => {
     try {
-      const data = await getEvents();
+      const data = await getEvents({ order: 'date' });
       setEvents(data);
     } catch (error) {
       console.error('Failed to load events:', error);
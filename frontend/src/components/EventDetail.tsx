@@ -18,7 +18,10 @@ import {
   shareEvent,
   Friend,
   getCurrentUser,
+  restoreEvent,
   User,
+  subscribeToEvent,
+  EventChange,
 } from '../api';
 import { Plus, ArrowLeft, LogOut, Trash2, Edit, ChevronDown, ChevronRight, Share2 } from 'lucide-react';
 
@@ -60,6 +63,37 @@ export default function EventDetail({ onLogout }: EventDetailProps) {
     loadCurrentUser();
   }, [id]);
 
+  // Apply changes made by co-planners without reloading the whole event
+  useEffect(() => {
+    return subscribeToEvent(Number(id), handleRemoteChange);
+  }, [id]);
+
+  const handleRemoteChange = (change: EventChange) => {
+    if (change.type === 'event.deleted') {
+      navigate('/');
+      return;
+    }
+    if (!change.type.startsWith('gift.')) {
+      loadData();
+      return;
+    }
+    setEvent((current) => {
+      if (!current) return current;
+      const recipientId = change.data.event_recipient_id;
+      return {
+        ...current,
+        recipients: current.recipients.map((recipient) => {
+          if (recipient.id !== recipientId) return recipient;
+          const others = recipient.gifts.filter((gift) => gift.id !== change.data.id);
+          const gifts = change.type === 'gift.deleted'
+            ? others
+            : [...others, change.data as Gift].sort((a, b) => a.id - b.id);
+          return { ...recipient, gifts };
+        }),
+      };
+    });
+  };
+
   const loadFriends = async () => {
     try {
       const data = await getFriends();
@@ -93,6 +127,15 @@ export default function EventDetail({ onLogout }: EventDetailProps) {
     }
   };
 
+  const handleRestore = async () => {
+    try {
+      await restoreEvent(Number(id));
+      loadData();
+    } catch (error) {
+      console.error('Failed to restore event:', error);
+    }
+  };
+
   const handleAddRecipients = async (e: React.FormEvent) => {
     e.preventDefault();
     try {
@@ -272,15 +315,29 @@ export default function EventDetail({ onLogout }: EventDetailProps) {
             <h2>Recipients & Gifts</h2>
             {event.date && <p style={{ color: '#6b7280', fontSize: '0.875rem' }}>Event Date: {event.date}</p>}
           </div>
-          <button
-            className="btn btn-primary"
-            onClick={() => setShowAddModal(true)}
-            disabled={availableContacts.length === 0}
-          >
-            <Plus size={16} /> Add Recipients
-          </button>
+          {event.archived ? (
+            currentUser && event.user_id === currentUser.id && (
+              <button className="btn btn-secondary" onClick={handleRestore}>
+                Restore from archive
+              </button>
+            )
+          ) : (
+            <button
+              className="btn btn-primary"
+              onClick={() => setShowAddModal(true)}
+              disabled={availableContacts.length === 0}
+            >
+              <Plus size={16} /> Add Recipients
+            </button>
+          )}
         </div>
 
+        {event.archived && (
+          <p style={{ color: '#6b7280', marginBottom: '1rem' }}>
+            This event is archived and read-only. Restore it to make changes.
+          </p>
+        )}
+
         {event.recipients.length === 0 ? (
           <p style={{ color: '#6b7280', textAlign: 'center', padding: '2rem' }}>
             No recipients yet. Add people to start tracking gifts!
@@ -7,8 +7,10 @@ import {
   acceptFriendRequest,
   rejectFriendRequest,
   searchUsers,
+  getFriendSuggestions,
   logout,
   Friend,
+  FriendSuggestion,
   FriendRequest as FriendRequestType,
 } from '../api';
 import { ArrowLeft, LogOut, Check, X, UserPlus } from 'lucide-react';
@@ -21,6 +23,7 @@ export default function Friends({ onLogout }: FriendsProps) {
   const navigate = useNavigate();
   const [friends, setFriends] = useState<Friend[]>([]);
   const [requests, setRequests] = useState<FriendRequestType[]>([]);
+  const [peopleYouMayKnow, setPeopleYouMayKnow] = useState<FriendSuggestion[]>([]);
   const [loading, setLoading] = useState(true);
   const [showAddModal, setShowAddModal] = useState(false);
   const [newFriendUsername, setNewFriendUsername] = useState('');
@@ -34,12 +37,14 @@ export default function Friends({ onLogout }: FriendsProps) {
 
   const loadData = async () => {
     try {
-      const [friendsData, requestsData] = await Promise.all([
+      const [friendsData, requestsData, suggestionsData] = await Promise.all([
         getFriends(),
         getFriendRequests(),
+        getFriendSuggestions(),
       ]);
       setFriends(friendsData);
       setRequests(requestsData);
+      setPeopleYouMayKnow(suggestionsData);
     } catch (error) {
       console.error('Failed to load friends:', error);
     } finally {
@@ -62,6 +67,15 @@ export default function Friends({ onLogout }: FriendsProps) {
     }
   };
 
+  const handleQuickAdd = async (username: string) => {
+    try {
+      await sendFriendRequest(username);
+      loadData();
+    } catch (error) {
+      console.error('Failed to send friend request:', error);
+    }
+  };
+
   const handleUsernameChange = async (value: string) => {
     setNewFriendUsername(value);
     
@@ -210,6 +224,37 @@ export default function Friends({ onLogout }: FriendsProps) {
         )}
       </div>
 
+      {peopleYouMayKnow.length > 0 && (
+        <div className="card">
+          <h2>People You May Know</h2>
+          <div style={{ display: 'flex', flexDirection: 'column', gap: '0.75rem' }}>
+            {peopleYouMayKnow.map((person) => (
+              <div
+                key={person.id}
+                style={{
+                  display: 'flex',
+                  justifyContent: 'space-between',
+                  alignItems: 'center',
+                  padding: '1rem',
+                  border: '1px solid #e5e7eb',
+                  borderRadius: '0.5rem',
+                }}
+              >
+                <div>
+                  <div style={{ fontWeight: 600 }}>{person.username}</div>
+                  <div style={{ fontSize: '0.875rem', color: '#6b7280' }}>
+                    {person.mutual_friends} mutual friend{person.mutual_friends === 1 ? '' : 's'}
+                  </div>
+                </div>
+                <button className="btn btn-small btn-primary" onClick={() => handleQuickAdd(person.username)}>
+                  <UserPlus size={14} /> Add
+                </button>
+              </div>
+            ))}
+          </div>
+        </div>
+      )}
+
       {showAddModal && (
         <div className="modal-overlay" onClick={() => setShowAddModal(false)}>
           <div className="modal" onClick={(e) => e.stopPropagation()}>
@@ -14,6 +14,7 @@ fi
 
 source venv/bin/activate
 pip install -r requirements.txt
+python migrate.py upgrade
 
 echo ""
 echo "✅ Backend setup complete!"